@@ -0,0 +1,76 @@
+import numpy as np
+
+
+class TimeWeighted:
+    """ Time-weighted statistics of a piecewise-constant level, such as the number of people on a bus.
+
+    The integral of the level over time is advanced lazily, only when the level changes, so the cost of
+    keeping the statistic is O(1) per change instead of O(1) per simulation event. The integral is also split
+    across fixed-width time bins (e.g. half-hours) as it is advanced. Changes reported before the time of the
+    previous change are applied at the time of the previous change, and time beyond max_time is ignored.
+
+    Args:
+        max_time (float) : length of the observation period (in minutes)
+        bin_width (float) : width of the time bins (in minutes). None keeps only the overall integral
+        level (float) : level at time 0
+    """
+    def __init__(self, max_time, bin_width=None, level=0):
+        self.max_time = max_time
+        self.bin_width = bin_width
+        self.level = level                  # current level
+        self.last_time = 0                  # time up to which the integral has been advanced
+        self.total = 0                      # integral of the level over [0, last_time]
+        num_bins = int(np.ceil(max_time / bin_width)) if bin_width else 0
+        self.bins = [0] * num_bins          # integral of the level over each time bin
+        self._bin = 0                       # bin containing last_time
+        self._bin_end = bin_width or 0      # end time of the current bin
+
+    def update(self, time, level):
+        """Record that the level changes to a new value at a given time"""
+        if time > self.last_time:
+            self.flush(time)
+        self.level = level
+
+    def flush(self, time):
+        """Advance the integral up to a given time at the current level"""
+        if time > self.max_time:
+            time = self.max_time
+        if time <= self.last_time:
+            return
+        if self.level:
+            self.total += self.level * (time - self.last_time)
+            if self.bins:
+                if time <= self._bin_end:       # common case: still within the current bin
+                    self.bins[self._bin] += self.level * (time - self.last_time)
+                else:
+                    self._add_to_bins(self.last_time, time)
+        elif self.bins and time > self._bin_end:
+            self._move_to_bin(time)
+        self.last_time = time
+
+    def _move_to_bin(self, time):
+        """Point the current bin at the bin containing a given time"""
+        self._bin = min(int(time / self.bin_width), len(self.bins) - 1)
+        self._bin_end = (self._bin + 1) * self.bin_width
+
+    def _add_to_bins(self, start, end):
+        """Split the integral of the current level over [start, end] across the time bins"""
+        width = self.bin_width
+        first = int(start / width)
+        last = min(int(end / width), len(self.bins) - 1)
+        if first == last:
+            self.bins[first] += self.level * (end - start)
+        else:
+            self.bins[first] += self.level * ((first + 1) * width - start)
+            for i in range(first + 1, last):
+                self.bins[i] += self.level * width
+            self.bins[last] += self.level * (end - last * width)
+        self._move_to_bin(end)
+
+    def mean(self):
+        """Time-average of the level over the observation period"""
+        return self.total / self.max_time
+
+    def bin_means(self):
+        """Array of the time-average of the level within each time bin"""
+        return np.array(self.bins) / self.bin_width
@@ -7,7 +7,7 @@ import os
 def draw_time_series(df, directory = None, save = False):
     """Generate the time-series using seaborn tsplot
     Args:
-        df (dataframe) : dataframe of stats generated by simulation
+        df (dataframe) : dataframe of stats generated by simulation (see results.load_results)
         directory (str) : used to create a folder to save images when save = True
         save (bool) : When True save the images
     """
@@ -19,18 +19,11 @@ def draw_time_series(df, directory = None, save = False):
                 ~df.keys().str.contains('Wegmans-West')& \
                 ~df.keys().str.contains('Commons-Eastbound-Wegmans-West')& \
                 ~df.keys().str.contains('Commons-Eastbound-Commons-Westbound ')]]
-    # read the string of array and convert the format
-    df_time.fillna(0)
-    lengh = 0
+    # time-series are numeric arrays; a path never travelled in a simulation has no observations
+    df_time = df_time.copy()
     for k in df_time.keys():
-        data = []
-        for i in df_time[k].values:
-            try:
-                length = len(np.fromstring(i, dtype=np.float, sep=' '))
-                data.append(np.fromstring(i, dtype=np.float, sep=' '))
-            except:
-                data.append([0]*length)
-        df_time[k] = data
+        df_time[k] = [np.nan_to_num(np.asarray(i, dtype=float)) if np.ndim(i) else np.zeros(0)
+                      for i in df_time[k].values]
     # add model for grouping
     df_time['model'] = df['model']
     df_time = df_time.sort_values(by = 'model')
@@ -57,7 +50,7 @@ def draw_time_series(df, directory = None, save = False):
 def draw_time_series_bus(df, directory = None, save = False):
     """Generate the time-series using seaborn tsplot
     Args:
-        df (dataframe) : dataframe of stats generated by simulation
+        df (dataframe) : dataframe of stats generated by simulation (see results.load_results)
         directory (str) : used to create a folder to save images when save = True
         save (bool) : When True save the images
     """
@@ -70,18 +63,11 @@ def draw_time_series_bus(df, directory = None, save = False):
                 ~df.keys().str.contains('Commons-Eastbound-Commons-Westbound')&\
                 ~df.keys().str.contains('Commons-Westbound-Commons-Eastbound')
                 ]]
-    # read the string of array and convert the format
-    df_time.fillna(0)
-    lengh = 0
+    # time-series are numeric arrays; a path never travelled in a simulation has no observations
+    df_time = df_time.copy()
     for k in df_time.keys():
-        data = []
-        for i in df_time[k].values:
-            try:
-                length = len(np.fromstring(i, dtype=np.float, sep=' '))
-                data.append(np.fromstring(i, dtype=np.float, sep=' '))
-            except:
-                data.append([0]*length)
-        df_time[k] = data
+        df_time[k] = [np.nan_to_num(np.asarray(i, dtype=float)) if np.ndim(i) else np.zeros(0)
+                      for i in df_time[k].values]
     # add model for grouping
     df_time['model'] = df['model']
     df_time = df_time.sort_values(by = 'model')
@@ -1,39 +1,126 @@
+import os
+import hashlib
 import numpy as np
-import pandas as pd
+from results import load_columns, save_columns
 
-def generate_arrival(rates, interval=180):
+_rate_tables = {}   # (absolute path, mtime) -> parsed rate table, shared within a process
+
+def generate_arrival(rates, interval=180, rng=None):
     """generate the data based on arrival rate (# arrival / hour)
+
+    Arrivals form a non-homogeneous Poisson process with a piecewise-constant rate. For each interval the
+    number of arrivals is drawn from a Poisson distribution and the arrival times are uniformly distributed
+    within the interval, so the whole stream costs a few vectorized NumPy calls.
     Args:
         rates (list) : list of arrival rate
-        interval (int) : when the arrival is non-stationary, decides the interval to
-        update the lambda. Default is 180 (up date every 3 hour)
+        interval (int or list) : when the arrival is non-stationary, decides the interval to
+        update the lambda. Default is 180 (up date every 3 hour). A list gives the width (in minutes)
+        of each interval separately.
+        rng (np.random.Generator) : source of random numbers. Default is the global NumPy random state
+    """
+    rng = np.random if rng is None else rng
+    rates = np.asarray(rates, dtype=float)
+    widths = np.broadcast_to(np.asarray(interval, dtype=float), rates.shape)
+    if np.any(rates < 0) or np.any(widths <= 0):
+        raise ValueError('Arrival rates must be non-negative and intervals positive.')
+    starts = np.concatenate(([0], np.cumsum(widths)[:-1]))
+
+    # number of arrivals in each interval, then their times spread uniformly over the interval
+    counts = rng.poisson(rates / 60 * widths)
+    arrival_data = np.repeat(starts, counts) + rng.uniform(size=counts.sum()) * np.repeat(widths, counts)
+    arrival_data.sort()
+    return arrival_data
+
+
+def generate_arrival_thinning(rate_function, max_time, max_rate, rng=None):
+    """generate the data for a smoothly varying arrival rate (# arrival / hour) by thinning
+
+    Candidate arrivals are generated at the constant rate max_rate and each candidate at time t is kept
+    with probability rate_function(t) / max_rate (Lewis & Shedler, 1979).
+    Args:
+        rate_function (callable) : vectorized function mapping an array of times (in minutes) to arrival rates
+        max_time (float) : number of minutes for which to generate arrivals
+        max_rate (float) : upper bound of rate_function over [0, max_time]
+        rng (np.random.Generator) : source of random numbers. Default is the global NumPy random state
+    """
+    rng = np.random if rng is None else rng
+    candidates = generate_arrival([max_rate], interval=max_time, rng=rng)
+    rates = np.asarray(rate_function(candidates), dtype=float)
+    if np.any(rates > max_rate):
+        raise ValueError('rate_function exceeds max_rate; thinning requires an upper bound.')
+    return candidates[rng.uniform(size=len(candidates)) * max_rate < rates]
+
+def remove_stale_copies(cache_dir, source, cache_file):
+    """Remove the binary copies of earlier versions of a spreadsheet (named <source><mtime>.npz)"""
+    for name in os.listdir(cache_dir):
+        stale = os.path.join(cache_dir, name)
+        version = name[len(source):-len('.npz')]
+        if name.startswith(source) and name.endswith('.npz') and version.isdigit() and stale != cache_file:
+            try:
+                os.remove(stale)
+            except OSError:     # e.g. removed by another process, or still open on Windows
+                pass
+
+
+def load_rates(path, cache_dir=None):
+    """load an arrival rate spreadsheet as a dict of arrays (key: column name, value: rates per interval)
+
+    The spreadsheet is parsed once and converted to a compact .npz file keyed by its path and modification
+    time; writing it removes the copies of earlier versions of the spreadsheet. Later calls (in any process)
+    load the binary copy, and repeated calls within a process return the same in-memory table. If the cache directory cannot be written (e.g. read-only data), the table is only
+    kept in memory. Arrays in the table are read-only.
+    Args:
+        path (str) : path to the spreadsheet of arrival rates
+        cache_dir (str) : directory for the binary copies. Default is a .cache folder next to the spreadsheet
     """
-    current_time = 0
-    arrival_data = []
-    # loop until the rates exhausts
-    for current_idx, rate in enumerate(rates):
-        c = 0
-        # refresh every interval
-        while current_time < interval * (current_idx+1):
-            inter_arrival = np.random.exponential(1/(rate/60))
-            current_time += inter_arrival
-            arrival_data.append(current_time)
-            c += 1
-    return np.array(arrival_data)
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    key = (path, mtime)
+    if key in _rate_tables:
+        return _rate_tables[key]
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(path), '.cache')
+    source = '{}-{}-'.format(os.path.basename(path), hashlib.sha1(path.encode()).hexdigest()[:16])
+    cache_file = os.path.join(cache_dir, '{}{}.npz'.format(source, mtime))
+
+    if os.path.exists(cache_file):
+        table = load_columns(cache_file)
+    else:
+        import pandas as pd     # only needed to parse the spreadsheet; keeps pandas off the engine's import path
+        df = pd.read_excel(path)
+        table = {str(name): np.asarray(df[name].values, dtype=float if df[name].dtype.kind in 'biuf' else str)
+                 for name in df.columns}
+        tmp_file = '{}.{}.tmp.npz'.format(cache_file, os.getpid())     # per process: workers may race to build it
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            save_columns(table, tmp_file, compressed=False)
+            os.replace(tmp_file, cache_file)
+            remove_stale_copies(cache_dir, source, cache_file)
+        except OSError:
+            # e.g. a read-only data directory: keep the table in memory only
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    for values in table.values():
+        values.flags.writeable = False
+    _rate_tables[key] = table
+    return table
+
 
 if __name__ == '__main__':
-    rates = pd.read_excel('data/ArrivalRates.xlsx')
+    rates = load_rates('data/ArrivalRates.xlsx')
     # weg - com
-    weg_com = generate_arrival(rates['Weg to Com'].values)
+    weg_com = generate_arrival(rates['Weg to Com'])
     # weg - ctown
-    weg_ctown = generate_arrival(rates['Weg to Ctown'].values)
+    weg_ctown = generate_arrival(rates['Weg to Ctown'])
     # com - ctown
-    com_ctown = generate_arrival(rates['Com to Ctown'].values)
+    com_ctown = generate_arrival(rates['Com to Ctown'])
     # com - weg
-    com_weg = generate_arrival(rates['Com to Weg'].values)
+    com_weg = generate_arrival(rates['Com to Weg'])
     # ctown - weg
-    ctown_weg = generate_arrival(rates['Ctown to Weg'].values)
+    ctown_weg = generate_arrival(rates['Ctown to Weg'])
     # ctown - com
-    ctown_com = generate_arrival(rates['Ctown to Com'].values)
+    ctown_com = generate_arrival(rates['Ctown to Com'])
 
     print(ctown_com)
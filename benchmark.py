@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import tracemalloc
+import contextlib
+import numpy as np
+from multiprocessing import Pool
+from experiment import ModelSpec, build_model
+from streams import replication_seed
+try:
+    import resource     # peak RSS of the whole run; not available on Windows
+except ImportError:
+    resource = None
+
+# point of the scaling grid that every axis is varied around
+BASE = {'buses': 7, 'rate': 1, 'horizon': 60*18, 'workers': 1}
+
+
+def bench_schedule(buses):
+    """Schedule of a fleet of a given size, spreading the buses evenly over the three routes"""
+    return tuple(tuple([i % 3 + 1] * 6) for i in range(buses))
+
+
+def run_one(unit):
+    """ Run one replication of a benchmark point and measure it
+    Args:
+        unit (tuple) : (ModelSpec, horizon, seed, trace memory)
+    Returns:
+        dict with the number of events, wall time (s) and peak traced memory (bytes, if traced)
+    """
+    spec, horizon, seed, trace = unit
+    m = build_model(spec)
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(None):     # silence the per-run report of Map.simulate
+        m.simulate(horizon, seed=seed)
+        m.collect_stats()
+    wall = time.perf_counter() - start
+    result = {'events': m.num_events, 'wall': wall}
+    if trace:
+        result['peak'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    m.reset()
+    return result
+
+
+def bench_point(buses, rate, horizon, workers, replications, arrival_data='data/ArrivalRates.xlsx', seed=0):
+    """ Measure one point of the scaling grid
+    Args:
+        buses (int) : number of buses
+        rate (float) : multiplier applied to every arrival rate
+        horizon (int) : simulated minutes per replication
+        workers (int) : number of worker processes running the replications
+        replications (int) : number of timed replications
+        arrival_data (str) : spreadsheet of arrival rates
+        seed (int) : root seed; every point uses the same replication seeds
+    Returns:
+        dict of the settings and measurements of the point
+    """
+    spec = ModelSpec(bench_schedule(buses), arrival_data, 'bench', 'heap', rate)
+    root = np.random.SeedSequence(seed)
+    units = [(spec, horizon, replication_seed(root, r), False) for r in range(replications)]
+
+    # peak memory is measured on a separate replication, since tracing slows the simulation down
+    memory = run_one((spec, horizon, replication_seed(root, replications), True))
+
+    start = time.perf_counter()
+    if workers > 1:
+        with Pool(workers) as pool:
+            runs = pool.map(run_one, units, chunksize=1)
+    else:
+        runs = [run_one(unit) for unit in units]
+    wall = time.perf_counter() - start
+
+    events = sum(run['events'] for run in runs)
+    return {'buses': buses, 'rate': rate, 'horizon': horizon, 'workers': workers, 'replications': replications,
+            'events per replication': events / replications,
+            'events/sec': events / sum(run['wall'] for run in runs),     # per worker
+            'throughput events/sec': events / wall,                     # all workers together
+            'wall per replication': float(np.mean([run['wall'] for run in runs])),
+            'peak memory MB': memory['peak'] / 2**20}
+
+
+def grid(buses, rates, horizons, workers, full=False):
+    """Points of the scaling grid: every combination if full, else each axis varied around a central point
+
+    The central point takes the value of BASE on every axis that includes it, and the first requested value on
+    the others, so only requested values are run.
+    """
+    axes = {'buses': buses, 'rate': rates, 'horizon': horizons, 'workers': workers}
+    if full:
+        return [dict(zip(axes, values)) for values in itertools.product(*axes.values())]
+    center = {axis: BASE[axis] if BASE[axis] in values else values[0] for axis, values in axes.items()}
+    points = [center]
+    for axis, values in axes.items():
+        points.extend(dict(center, **{axis: value}) for value in dict.fromkeys(values) if value != center[axis])
+    return points
+
+
+def point_key(point):
+    return '{buses}-{rate}-{horizon}-{workers}'.format(**point)
+
+
+def compare(results, baseline, tolerance=0.2):
+    """ Compare benchmark results against a baseline
+    Args:
+        results (list) : results of bench_point
+        baseline (list) : results of an earlier run
+        tolerance (float) : relative slowdown (or memory growth) tolerated before a point counts as a regression
+    Returns:
+        list of (point key, measurement, baseline value, new value) of the regressions
+    """
+    reference = {point_key(point): point for point in baseline}
+    regressions = []
+    for point in results:
+        old = reference.get(point_key(point))
+        if old is None:
+            continue
+        if point['events/sec'] < old['events/sec'] * (1 - tolerance):
+            regressions.append((point_key(point), 'events/sec', old['events/sec'], point['events/sec']))
+        for measurement in ('wall per replication', 'peak memory MB'):
+            if point[measurement] > old[measurement] * (1 + tolerance):
+                regressions.append((point_key(point), measurement, old[measurement], point[measurement]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulation engine over a scaling grid')
+    parser.add_argument('--buses', type=int, nargs='+', default=[7, 14, 28])
+    parser.add_argument('--rates', type=float, nargs='+', default=[1, 2, 4], help='arrival rate multipliers')
+    parser.add_argument('--horizons', type=int, nargs='+', default=[60*6, 60*18], help='simulated minutes')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--replications', type=int, default=3)
+    parser.add_argument('--full', action='store_true', help='run every combination instead of one axis at a time')
+    parser.add_argument('--arrival-data', default='data/ArrivalRates.xlsx')
+    parser.add_argument('--output', default='reports/benchmark.json')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = []
+    for point in grid(args.buses, args.rates, args.horizons, args.workers, args.full):
+        result = bench_point(replications=args.replications, arrival_data=args.arrival_data, **point)
+        results.append(result)
+        print('{:>4} buses  rate x{:<4g} {:>5} min  {:>2} workers : {:>9.0f} events/s  {:.3f} s/replication  '
+              '{:.1f} MB'.format(result['buses'], result['rate'], result['horizon'], result['workers'],
+                                 result['events/sec'], result['wall per replication'], result['peak memory MB']))
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+                   'max rss MB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10 if resource else None,
+                   'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        for key, measurement, old, new in regressions:
+            print('REGRESSION {}: {} {:.4g} -> {:.4g}'.format(key, measurement, old, new))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
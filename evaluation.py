@@ -0,0 +1,224 @@
+import os
+import json
+import hashlib
+import numpy as np
+from experiment import ModelSpec, experiment, run_units
+from streams import replication_seed
+from results import from_frame, load_results, save_results, to_columns, to_frame
+
+# source files whose contents determine simulation results; part of every cache key
+ENGINE_FILES = ['pySimio.py', 'experiment.py', 'arrival.py', 'event_list.py', 'population.py', 'streams.py',
+                'accumulator.py', 'network.py']
+_code_version = None
+
+
+def code_version():
+    """Hash of the simulation engine's source code"""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha1()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in ENGINE_FILES:
+            with open(os.path.join(directory, name), 'rb') as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def canonical_schedule(routes_per_bus):
+    """ Canonical form of a schedule: its rows (one per bus) in sorted order.
+
+    All buses are built identically by create_map and start according to the first route of their own
+    schedule (buses starting on route 1 leave the depot at time 1, buses starting on route 2 first drive
+    route 1 to switch over), so permuting the rows of a schedule only renames buses: the resulting model is
+    statistically equivalent, and objectives averaged over buses are unaffected. Sorting the rows picks one
+    representative of every such permutation class, which is what gets simulated and cached.
+    Args:
+        routes_per_bus (list) : route of each bus in each 3-hour block
+    Returns:
+        tuple of tuples of ints
+    """
+    return tuple(sorted(tuple(int(route) for route in routes) for routes in routes_per_bus))
+
+
+def relabel_buses(stats, routes_per_bus):
+    """ Rename the per-bus stats of the canonical form of a schedule after the buses of the schedule itself.
+
+    Bus k of the canonical schedule (named 'Bus<k>' by create_map) drives the k-th row in sorted order; its
+    stats (e.g. 'Bus<k> avg occupancy') are renamed after the bus with that row in routes_per_bus. Buses with
+    identical rows are interchangeable and keep their relative order.
+    Args:
+        stats (DataFrame) : stats of the canonical schedule
+        routes_per_bus (list) : schedule in the caller's bus order
+    Returns:
+        DataFrame with the same columns, in the same order, relabelled to the caller's buses
+    """
+    rows = [tuple(int(route) for route in routes) for routes in routes_per_bus]
+    order = sorted(range(len(rows)), key=lambda i: rows[i])     # canonical position -> caller's bus index
+    names = {'Bus' + str(k + 1): 'Bus' + str(i + 1) for k, i in enumerate(order) if k != i}
+    if not names:
+        return stats
+    columns = {column: names[column.split(' ', 1)[0]] + ' ' + column.split(' ', 1)[1]
+               for column in stats.columns if ' ' in column and column.split(' ', 1)[0] in names}
+    return stats.rename(columns=columns)[list(stats.columns)]
+
+
+def seed_policy(seed, common_random_numbers):
+    """Description of how the replications of an evaluation are seeded; part of its cache key"""
+    return {'seed': seed, 'common random numbers': common_random_numbers}
+
+
+class EvaluationCache:
+    """ On-disk cache of the per-replication stats of evaluated schedules.
+
+    Entries are keyed by the schedule matrix, simulation length, number of replications, seed policy, arrival
+    data and the version of the simulation code, and hold the full stats of every replication, so any objective
+    can be computed from a cached evaluation.
+
+    Args:
+        directory (str) : directory in which the cached evaluations are stored
+    """
+    def __init__(self, directory='results/cache'):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, routes_per_bus, max_time, replications, seed_policy, arrival_data):
+        """Cache key of an evaluation"""
+        description = {'schedule': [list(map(int, routes)) for routes in routes_per_bus], 'max_time': max_time,
+                       'replications': replications, 'seed policy': seed_policy,
+                       'arrival data': [os.path.abspath(arrival_data), os.stat(arrival_data).st_mtime_ns],
+                       'code version': code_version()}
+        return hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        """Return the cached stats (a DataFrame) of an evaluation, or None"""
+        if not os.path.exists(self._path(key)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return load_results(self._path(key))
+
+    def put(self, key, stats):
+        """Store the stats (a DataFrame) of an evaluation"""
+        tmp_path = os.path.join(self.directory, '{}.{}.tmp.npz'.format(key, os.getpid()))
+        save_results(from_frame(stats), tmp_path)
+        os.replace(tmp_path, self._path(key))
+
+
+def avg_waiting_time(stats):
+    """Average total waiting time over the bus stops"""
+    return stats[stats.columns[stats.columns.str.contains('waiting time total')]].mean().values.mean()
+
+
+def avg_queue_length(stats):
+    """Average number of people waiting at the bus stops where riders board"""
+    names = stats.columns
+    return stats[names[names.str.contains('avg people waiting') & ~names.str.contains('Depot') &
+                       ~names.str.contains('Wegmans-Westbound')]].mean().values.mean()
+
+
+def avg_occupancy(stats):
+    """Average occupancy of the buses"""
+    names = stats.columns
+    return stats[names[names.str.contains('avg occupancy') & names.str.contains('Bus')]].mean().values.mean()
+
+
+def dead_people(stats):
+    """Average number of people who never reached their destination"""
+    return stats['total dead people'].values.mean()
+
+
+def evaluate(routes_per_bus, max_time=60*18, replications=10, seed=None, common_random_numbers=False,
+             arrival_data='data/ArrivalRates.xlsx', cache=None, workers=None):
+    """Simulate a schedule (one row of routes per bus), reusing a cached evaluation when available
+    Args:
+        routes_per_bus (list) : route of each bus in each 3-hour block. Schedules that only differ by the order of
+            the buses are evaluated as the same schedule (see canonical_schedule); per-bus stats are returned
+            under the names of the buses in routes_per_bus (see relabel_buses)
+        max_time (int) : duration time for each simulation
+        replications (int) : number of replications
+        seed (int) : root seed of the replications. None draws fresh entropy (cached results are still reused)
+        common_random_numbers (bool) : passed on to experiment
+        arrival_data (str) : spreadsheet of arrival rates
+        cache (EvaluationCache) : cache of evaluations. None always simulates
+        workers (int) : number of worker processes
+    Returns:
+        DataFrame of the stats of each replication
+    """
+    schedule = canonical_schedule(routes_per_bus)
+    if cache is not None:
+        key = cache.key(schedule, max_time, replications, seed_policy(seed, common_random_numbers), arrival_data)
+        stats = cache.get(key)
+        if stats is not None:
+            return relabel_buses(stats, routes_per_bus)
+
+    model = ModelSpec(schedule, arrival_data, 'model', 'heap')
+    stats = experiment([model], max_time, replications, output_report=False, printing=False, seed=seed,
+                       common_random_numbers=common_random_numbers, workers=workers)
+    if cache is not None:
+        cache.put(key, stats)       # the cache holds the stats of the canonical schedule
+    return relabel_buses(stats, routes_per_bus)
+
+
+def evaluate_batch(candidates, objective, max_time=60*18, replications=10, seed=None, common_random_numbers=False,
+                   arrival_data='data/ArrivalRates.xlsx', cache=None, workers=None, chunksize=None):
+    """ Evaluate many candidate schedules at once, running all their replications across a pool of workers
+
+    Every candidate is simulated exactly as evaluate would simulate it on its own (same canonical form, same
+    seeds, same cache entries, stats relabelled to the candidate's buses). Candidates found in the cache are
+    yielded first; the others are yielded as soon as their last replication completes, so a search can act on
+    early results while the rest of the batch is still running.
+    Args:
+        candidates (list) : candidate schedules, each a list with the routes of each bus in each 3-hour block
+        objective (function) : maps the stats (DataFrame) of a candidate to the value to optimize,
+            e.g. avg_waiting_time
+        max_time (int) : duration time for each simulation
+        replications (int) : number of replications per candidate
+        seed (int) : root seed of the replications. None draws fresh entropy (the same for the whole batch)
+        common_random_numbers (bool) : passed on to experiment
+        arrival_data (str) : spreadsheet of arrival rates
+        cache (EvaluationCache) : cache of evaluations. None always simulates
+        workers (int) : number of worker processes. Default is the number of CPUs
+        chunksize (int) : number of replications sent to a worker at a time
+    Returns:
+        iterator over (candidate index, objective value) pairs in order of completion
+    """
+    policy = seed_policy(seed, common_random_numbers)
+    root = np.random.SeedSequence(seed)
+    replication_seeds = [replication_seed(root, r, None if common_random_numbers else 0) for r in range(replications)]
+
+    # identical candidates (up to the order of the buses) are simulated once
+    duplicates = {}     # canonical schedule -> indices of the candidates with that schedule
+    for i, routes_per_bus in enumerate(candidates):
+        duplicates.setdefault(canonical_schedule(routes_per_bus), []).append(i)
+
+    units, pending = [], {}     # pending: schedule -> [cache key, stats of each replication, replications left]
+    for schedule, indices in duplicates.items():
+        key = None
+        if cache is not None:
+            key = cache.key(schedule, max_time, replications, policy, arrival_data)
+            stats = cache.get(key)
+            if stats is not None:
+                for i in indices:
+                    yield i, objective(relabel_buses(stats, candidates[i]))
+                continue
+        pending[schedule] = [key, [None] * replications, replications]
+        spec = ModelSpec(schedule, arrival_data, 'model', 'heap')     # as built by evaluate
+        for r in range(replications):
+            units.append((len(units), spec, max_time, False, r, replication_seeds[r]))
+
+    for index, stats in run_units(units, workers, chunksize):
+        schedule = units[index][1].routes_per_bus
+        entry = pending[schedule]
+        entry[1][stats['iteration']] = stats
+        entry[2] -= 1
+        if entry[2] == 0:       # last replication of this candidate
+            df = to_frame(to_columns(entry[1]))
+            if cache is not None:
+                cache.put(entry[0], df)
+            for i in duplicates[schedule]:
+                yield i, objective(relabel_buses(df, candidates[i]))
@@ -0,0 +1,143 @@
+import heapq
+
+
+class HeapQueue:
+    """ Future event list backed by a binary heap.
+
+    Events are ordered by time; ties are broken by insertion order so that events scheduled at the
+    same time are processed first-in, first-out.
+    """
+    def __init__(self):
+        self._heap = []             # heap of (time, sequence number, event) entries
+        self._seq = 0               # sequence number used for stable tie-breaking
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, time, event):
+        """Schedule an event at a given time"""
+        heapq.heappush(self._heap, (time, self._seq, event))
+        self._seq += 1
+
+    def pop(self):
+        """Remove and return the earliest event"""
+        return heapq.heappop(self._heap)[2]
+
+    def peek_time(self):
+        """Return the time of the earliest event without removing it"""
+        return self._heap[0][0]
+
+    def clear(self):
+        """Remove all scheduled events"""
+        self._heap = []
+        self._seq = 0
+
+
+class CalendarQueue:
+    """ Future event list implemented as a calendar queue (Brown, 1988).
+
+    Events are hashed into buckets ("days") of a fixed width that together make up a "year". Enqueue and
+    dequeue are O(1) on average, which pays off over a binary heap when a large fleet keeps many events
+    pending. The number of buckets and their width are re-estimated whenever the queue grows or shrinks
+    by a factor of two. Ties are broken by insertion order, as in HeapQueue.
+
+    Args:
+        num_buckets (int) : initial number of buckets
+        bucket_width (float) : initial width (in minutes) of each bucket
+    """
+    min_buckets = 2
+
+    def __init__(self, num_buckets=16, bucket_width=1.0):
+        self._seq = 0
+        self._size = 0
+        self._setup(num_buckets, bucket_width, 0)
+
+    def __len__(self):
+        return self._size
+
+    def _setup(self, num_buckets, bucket_width, day):
+        """Create empty buckets and point the calendar at a given day"""
+        self._buckets = [[] for _ in range(num_buckets)]   # each bucket is a heap of entries
+        self._num_buckets = num_buckets
+        self._width = bucket_width
+        self._day = day                                     # index of the day currently being dequeued
+
+    def _insert(self, entry):
+        day = int(entry[0] / self._width)
+        heapq.heappush(self._buckets[day % self._num_buckets], entry)
+        if day < self._day:                                 # event scheduled before the current day
+            self._day = day
+
+    def push(self, time, event):
+        """Schedule an event at a given time"""
+        self._insert((time, self._seq, event))
+        self._seq += 1
+        self._size += 1
+        if self._size > 2 * self._num_buckets:
+            self._resize(2 * self._num_buckets)
+
+    def pop(self):
+        """Remove and return the earliest event"""
+        if self._size == 0:
+            raise IndexError('pop from an empty event list')
+
+        # scan one year of buckets, starting at the current day
+        for _ in range(self._num_buckets):
+            bucket = self._buckets[self._day % self._num_buckets]
+            if bucket and int(bucket[0][0] / self._width) <= self._day:
+                return self._remove(bucket)
+            self._day += 1
+
+        # nothing within a year: jump directly to the bucket holding the earliest event
+        bucket = min((b for b in self._buckets if b), key=lambda b: b[0])
+        self._day = int(bucket[0][0] / self._width)
+        return self._remove(bucket)
+
+    def _remove(self, bucket):
+        entry = heapq.heappop(bucket)
+        self._size -= 1
+        if self._size < self._num_buckets // 2 and self._num_buckets > self.min_buckets:
+            self._resize(self._num_buckets // 2)
+        return entry[2]
+
+    def peek_time(self):
+        """Return the time of the earliest event without removing it"""
+        return min(b[0] for b in self._buckets if b)[0]
+
+    def _resize(self, num_buckets):
+        """Rebuild the calendar with a new number of buckets and a re-estimated bucket width"""
+        entries = [entry for bucket in self._buckets for entry in bucket]
+        width = self._estimate_width(entries)
+        self._setup(num_buckets, width, int(min(entries)[0] / width) if entries else 0)
+        for entry in entries:
+            self._insert(entry)
+
+    def _estimate_width(self, entries):
+        """Estimate bucket width as three times the mean separation of the earliest events"""
+        times = [entry[0] for entry in heapq.nsmallest(25, entries)]
+        gaps = [b - a for a, b in zip(times, times[1:]) if b > a]
+        if not gaps:
+            return self._width
+        return 3 * sum(gaps) / len(gaps)
+
+    def clear(self):
+        """Remove all scheduled events"""
+        self._seq = 0
+        self._size = 0
+        self._setup(self._num_buckets, self._width, 0)
+
+
+EVENT_LISTS = {'heap': HeapQueue, 'calendar': CalendarQueue}
+
+
+def make_event_list(kind='heap'):
+    """Create an empty future event list
+    Args:
+        kind (str or callable) : 'heap' (binary heap, default), 'calendar' (calendar queue),
+            or a callable returning an object with push/pop/__len__
+    """
+    if callable(kind):
+        return kind()
+    if kind not in EVENT_LISTS:
+        raise ValueError('Unknown event list {!r}; expected one of {}'.format(kind, sorted(EVENT_LISTS)))
+    return EVENT_LISTS[kind]()
@@ -0,0 +1,133 @@
+import os
+import json
+import struct
+import numpy as np
+from instrument import MethodWrappers
+
+MAGIC = b'PYSIMTR1'
+EVENT_TYPES = ('arrival', 'departure')
+# one fixed-size record per event; occupancy and queue length are taken right after the event is processed
+RECORD = np.dtype([('time', '<f8'), ('bus', '<i2'), ('stop', '<i2'), ('type', 'u1'), ('occupancy', '<i2'),
+                   ('queue', '<i4')])
+
+
+class TraceRecorder:
+    """ Records every event of a run of Map.simulate to a compact binary file.
+
+    Passed to Map.simulate(trace=...), it wraps Bus.arrive and Bus.depart of that map's buses for the duration of
+    the run, so untraced runs cost nothing extra. Each event is stored as one fixed-size record (see RECORD) with
+    the bus (index in Map.buses) and stop (BusStop.id) as integers; their names are kept in the file header.
+    Records are buffered and written in blocks. Each run overwrites the file.
+
+    Args:
+        path (str) : file name of the trace
+        buffer_size (int) : number of records buffered before they are written
+    """
+    def __init__(self, path, buffer_size=65536):
+        self.path = path
+        self.buffer = np.empty(buffer_size, dtype=RECORD)
+        self.count = 0      # number of records in the buffer
+        self.file = None
+        self._wrappers = MethodWrappers()       # wrappers set on the map's buses during a run
+
+    def attach(self, m):
+        """Write the header and wrap the event methods of a map's buses (called by Map.simulate)"""
+        stops = sorted(m.bus_stops.values(), key=lambda stop: stop.id)
+        header = json.dumps({'map': str(m.name), 'buses': [bus.name for bus in m.buses],
+                             'stops': [stop.name for stop in stops], 'types': EVENT_TYPES,
+                             'record': RECORD.descr}).encode()
+        offset = len(MAGIC) + 4 + len(header)
+        header += b' ' * (-offset % RECORD.itemsize)    # records start at a multiple of the record size
+        self.file = open(self.path, 'wb')
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        self.count = 0
+
+        for index, bus in enumerate(m.buses):
+            for code, attr in enumerate(('arrive', 'depart')):     # codes follow EVENT_TYPES
+                self._wrappers.wrap(bus, attr, self._recorded(getattr(bus, attr), bus, index, code))
+
+    def _recorded(self, method, bus, index, code):
+        """Wrap Bus.arrive or Bus.depart so that each call is recorded after it is processed"""
+        record = self.record
+
+        def recorded(stop, time, *args, **kwargs):
+            event = method(stop, time, *args, **kwargs)
+            record(time, index, stop.id, code, bus.occupancy, stop.num_waiting)
+            return event
+        return recorded
+
+    def record(self, time, bus, stop, event_type, occupancy, queue):
+        """Append one event record"""
+        if self.count == len(self.buffer):
+            self.flush()
+        self.buffer[self.count] = (time, bus, stop, event_type, occupancy, queue)
+        self.count += 1
+
+    def flush(self):
+        """Write the buffered records to the file"""
+        self.buffer[:self.count].tofile(self.file)
+        self.count = 0
+
+    def detach(self):
+        """Write the remaining records, close the file and remove the wrappers (called by Map.simulate)"""
+        self._wrappers.remove()
+        if self.file is None:       # already detached, or the file could not be opened
+            return
+        try:
+            self.flush()
+        finally:
+            self.file.close()
+            self.file = None
+
+
+class TraceReader:
+    """ Memory-mapped view of a trace written by TraceRecorder.
+
+    Records are read from disk on demand, so a trace of millions of events can be scrubbed through or filtered
+    with NumPy without loading it (or re-running the simulation).
+
+    Args:
+        path (str) : file name of the trace
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('{} is not a PySimio event trace'.format(path))
+            length, = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(length))
+        self.map = header['map']
+        self.buses = header['buses']
+        self.stops = header['stops']
+        self.types = header['types']
+        offset = len(MAGIC) + 4 + length
+        dtype = np.dtype([tuple(field) for field in header['record']])
+        count = (os.path.getsize(path) - offset) // dtype.itemsize
+        self.records = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,)) if count else \
+            np.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def between(self, start, end):
+        """Records of the events in the time window [start, end)"""
+        times = self.records['time']
+        return self.records[np.searchsorted(times, start, side='left'):np.searchsorted(times, end, side='left')]
+
+    def print_events(self, records=None):
+        """Print records in the format of Event.print_event (all records by default)"""
+        for record in self.records if records is None else records:
+            print("{} : {} event at {} at t = {} (occupancy {}, queue {})\n".format(
+                self.buses[record['bus']], self.types[record['type']], self.stops[record['stop']], record['time'],
+                record['occupancy'], record['queue']))
+
+    def to_frame(self):
+        """DataFrame of all records, with bus, stop and event type names"""
+        import pandas as pd
+        df = pd.DataFrame(self.records)
+        df['bus'] = np.array(self.buses)[df['bus']]
+        df['stop'] = np.array(self.stops)[df['stop']]
+        df['type'] = np.array(self.types)[df['type']]
+        return df
@@ -1,10 +1,23 @@
 from pySimio import *
+from arrival import load_rates
+from streams import replication_seed
+from results import to_columns, to_frame, save_results
+from sink import ResultSink, seed_key
 import pandas as pd
+import os
+import math
+from statistics import NormalDist
 from multiprocessing import Pool
-from itertools import chain
+from collections import namedtuple, OrderedDict
 
+# small picklable description of a map built by create_map; sent to workers instead of the map itself
+ModelSpec = namedtuple('ModelSpec', ['routes_per_bus', 'arrival_data', 'name', 'event_list', 'rate_multiplier'],
+                       defaults=(1,))
+MAX_MODELS = 4          # number of maps built from specs that each process keeps for reuse
+_models = OrderedDict()  # ModelSpec -> Map, maps most recently built (or used) in this process, oldest first
 
-def create_map(routes_per_bus, arrival_data='data/ArrivalRates.xlsx', name=None):
+
+def create_map(routes_per_bus, arrival_data='data/ArrivalRates.xlsx', name=None, event_list='heap', rate_multiplier=1):
 
     # create BusStop objects
     depot = BusStop('TDOG Depot')
@@ -15,11 +28,14 @@ def create_map(routes_per_bus, arrival_data='data/ArrivalRates.xlsx', name=None)
     ctown = BusStop('Collegetown')
 
     # feed arrival rate data to each bus stop
-    rates = pd.read_excel(arrival_data)
-    weg_east.add_data({com_east: rates['Weg to Com'].values, ctown: rates['Weg to Ctown'].values})
-    com_east.add_data({ctown: rates['Com to Ctown'].values})
-    com_west.add_data({weg_west: rates['Com to Weg'].values})
-    ctown.add_data({com_west: rates['Ctown to Com'].values, weg_west: rates['Ctown to Weg'].values})
+    rates = load_rates(arrival_data)   # parsed once per spreadsheet, then cached
+    if rate_multiplier != 1:            # scale every arrival rate, e.g. to simulate heavier demand
+        rates = {name: values * rate_multiplier if values.dtype.kind == 'f' else values
+                 for name, values in rates.items()}
+    weg_east.add_data({com_east: rates['Weg to Com'], ctown: rates['Weg to Ctown']})
+    com_east.add_data({ctown: rates['Com to Ctown']})
+    com_west.add_data({weg_west: rates['Com to Weg']})
+    ctown.add_data({com_west: rates['Ctown to Com'], weg_west: rates['Ctown to Weg']})
 
     # route distance data
     r1d = [0.5, 2, 2, 2, 2, 0.5]
@@ -49,67 +65,316 @@ def create_map(routes_per_bus, arrival_data='data/ArrivalRates.xlsx', name=None)
         bus_list.append(Bus(name='Bus'+str(bus_num), route=eval('route'+str(start_route)), schedule=routes_per_hr))
         bus_num += 1
 
-    return Map([route1, route2, route3], bus_list,
-               {'TDOG Depot': depot, 'Wegmans-Eastbound': weg_east, 'Wegmans-Westbound': weg_west,
-                'Commons-Eastbound': com_east, 'Commons-Westbound': com_west, 'Collegetown': ctown}, name = name)
+    m = Map([route1, route2, route3], bus_list,
+            {'TDOG Depot': depot, 'Wegmans-Eastbound': weg_east, 'Wegmans-Westbound': weg_west,
+             'Commons-Eastbound': com_east, 'Commons-Westbound': com_west, 'Collegetown': ctown}, name = name,
+            event_list=event_list)
+    m.spec = ModelSpec(tuple(tuple(routes) for routes in routes_per_bus), arrival_data, name, event_list,
+                       rate_multiplier)
+    return m
 
 
-def thread_process(models):
-    """ atomic process computed by each thread """
-    # retrieve the arguments from the keyword-arguments
-    m = models['model']
-    max_time = models['max_time']
-    debug = models['debug']
-    iteration = models['iteration']
+def build_model(spec):
+    """Build the map described by a model spec; the most recently used maps of each process are reused"""
+    if isinstance(spec, Map):
+        return spec
+    if spec in _models:
+        _models.move_to_end(spec)
+    else:
+        _models[spec] = create_map(**spec._asdict())
+        if len(_models) > MAX_MODELS:
+            _models.popitem(last=False)
+    return _models[spec]
 
-    results = []
-    for i in range(iteration):
-        m.simulate(max_time, debug=debug)   # run simulation
-        # collect statistics
-        stats = m.collect_stats()
-        stats["model"] = m.name
-        stats['iteration']=i
-        m.reset()  # reset the simulation
-        results.append(stats)
-    return results
+
+def model_identity(model):
+    """Name and spec of a map or ModelSpec, as recorded in the manifest of a ResultSink"""
+    spec = model if isinstance(model, ModelSpec) else getattr(model, 'spec', None)
+    if spec is None:            # a map not built by create_map is only known by its name
+        return {'name': str(model.name), 'spec': None}
+    return {'name': str(model.name),
+            'spec': dict(spec._asdict(), routes_per_bus=[[int(route) for route in routes]
+                                                         for routes in spec.routes_per_bus],
+                         rate_multiplier=float(spec.rate_multiplier))}
+
+
+def run_replication(unit):
+    """ atomic process computed by each worker: one replication of one model """
+    index, spec, max_time, debug, replication, seed = unit
+    m = build_model(spec)
+    m.simulate(max_time, debug=debug, seed=seed)   # run simulation
+    # collect statistics
+    stats = m.collect_stats()
+    stats["model"] = m.name
+    stats['iteration'] = replication
+    m.reset()  # reset the simulation
+    return index, stats
 
 
 def model_name(route):
     return str(route[0]) + str(route[1]) + str(route[2])
 
 
-def experiment(models, max_time, iteration, output_report=True, output='reports.csv', debug=False, printing=True):
+def run_units(units, workers=None, chunksize=None):
+    """ Run work units (see run_replication) across a pool of worker processes
+    Args:
+        units (list) : work units; the first entry of each unit is its index
+        workers (int) : number of worker processes. Default is the number of CPUs
+        chunksize (int) : number of units sent to a worker at a time. Default balances the load with about
+            four chunks per worker
+    Returns:
+        iterator over (unit index, stats) pairs in order of completion
+    """
+    if not units:
+        return
+    workers = min(workers or os.cpu_count() or 1, len(units))
+    if chunksize is None:
+        chunksize = max(1, len(units) // (4 * workers))
+    pool = Pool(workers) if workers > 1 else None  # run multiprocessing
+    try:
+        outputs = pool.imap_unordered(run_replication, units, chunksize) if pool else map(run_replication, units)
+        for output in outputs:
+            yield output
+    finally:
+        if pool:
+            pool.terminate()
+
+
+def replicate(models, max_time, replications, root, common_random_numbers=False, debug=False, workers=None,
+              chunksize=None, sink=None):
+    """ Run replications of several models in parallel
+    Args:
+        models (list) : list of (model index, map object) pairs; the index selects the random streams
+        max_time (int) : duration time for each simulation
+        replications (iterable) : indices of the replications to run for every model
+        root (SeedSequence) : root seed of the experiment
+        common_random_numbers (bool) : if true, replication i of every model uses the same seed
+        debug (bool) : if true, run simulation with DEBUG mode
+        workers (int) : number of worker processes. Default is the number of CPUs
+        chunksize (int) : number of replications sent to a worker at a time. Default balances the load
+            with about four chunks per worker
+        sink (ResultSink) : if given, results are appended to the sink as they complete (and not returned),
+            and units already recorded in it are skipped
+    Returns:
+        list of (model index, stats) pairs in (model, replication) order
+    """
+    completed = sink.completed() if sink is not None else set()
+
+    # one work unit per (model, replication); workers receive the model spec rather than the whole map
+    units, replicas = [], []
+    for i, m in models:
+        for r in replications:
+            replication = replication_seed(root, r, None if common_random_numbers else i)
+            if (i, r, seed_key(replication)) in completed:     # by index: models may share a name
+                continue
+            units.append((len(units), getattr(m, 'spec', m), max_time, debug, r, replication))
+            replicas.append((i, str(m.name), r, replication))
+
+    results = []
+    for index, stats in run_units(units, workers, chunksize):
+        if sink is not None:
+            sink.append(*replicas[index], stats)   # stream to disk as each replication completes
+        else:
+            results.append((index, stats))
+    results.sort(key=lambda result: result[0])
+    return [(replicas[index][0], stats) for index, stats in results]
+
+
+def experiment(models, max_time, iteration, output_report=None, output='reports.npz', debug=False, printing=True,
+               seed=None, common_random_numbers=False, workers=None, chunksize=None, sink=None, return_results=None):
     """ Run the experiment with input models
     Args:
-        models (list) : list of map objects
+        models (list) : list of map objects, or of ModelSpecs (the maps are then built where they are simulated)
         max_time (int) : duration time for each simulation
         iteration (int) : number of experiments to repeat
-        output_report (bool) : if true, generate csv file of simulation results
-        output (str) : file name for the simulation output
+        output_report (bool) : if true, save the simulation results in reports/ (see results.save_results).
+            Default is true without a sink and false with one
+        output (str) : file name for the simulation output (.npz)
         debug (bool) : if true, run simulation with DEBUG mode
+        seed (int) : root seed of the experiment. None draws fresh entropy
+        common_random_numbers (bool) : if true, replication i of every model uses identical arrival,
+            boarding-time and driving-time streams, so paired differences between models have lower variance
+        workers (int) : number of worker processes. Default is the number of CPUs
+        chunksize (int) : number of replications sent to a worker at a time. Default balances the load
+            with about four chunks per worker
+        sink (str or ResultSink) : if given, append each replication's results to this file as it completes
+            instead of holding them in memory. Running the experiment again with the same sink and models resumes
+            it, skipping the (model, replication, seed) units already recorded
+        return_results (bool) : if false, do not load the results into a DataFrame at the end (returns None).
+            Default is true without a sink and false with one, so that a streamed experiment never holds all
+            of its results in memory; they are read back with ResultSink.load or ResultSink.read
     """
-    assert(all(isinstance(model, Map) for model in models)), "models must be a list of Map objects"
+    assert(all(isinstance(model, (Map, ModelSpec)) for model in models)), \
+        "models must be a list of Map objects or ModelSpecs"
+    if output_report is None:
+        output_report = sink is None
+    if return_results is None:
+        return_results = sink is None
     # begin simulations
     if printing:
         print("{} simulations with {} models begins ...".format(iteration, len(models)))
 
-    # shared variable to combine each simulation results
-    results = []
-    thread = Pool(len(models))  # initialize threads for each model
-    # create keyword-arguments
-    args = [{'model': m, 'debug': debug, 'max_time': max_time, 'results': results, 'iteration': iteration}
-            for i, m in enumerate(models)]
-    stats = thread.map(thread_process, args)  # run multiprocessing
-    stats = list(chain(*stats))
-    thread.terminate()  # kill the thread
-    if printing:
-        print(pd.DataFrame(stats).groupby('model').mean())
-        print("experiment done")
+    if sink is not None:
+        sink = sink if isinstance(sink, ResultSink) else ResultSink(sink)
+        root = sink.open(max_time, seed, common_random_numbers, [model_identity(model) for model in models])
+    else:
+        root = np.random.SeedSequence(seed)
+
+    results = replicate(list(enumerate(models)), max_time, range(iteration), root, common_random_numbers,
+                        debug=debug, workers=workers, chunksize=chunksize, sink=sink)
+
+    if sink is not None:
+        if printing:
+            print(sink.summary())
+            print("experiment done")
+        if not (return_results or output_report):
+            return None
+        stats = sorted(((i, stats) for i, stats in sink.read_indexed() if i < len(models)),
+                       key=lambda unit: (unit[0], unit[1]['iteration']))
+        columns = to_columns([unit[1] for unit in stats])
+        df = to_frame(columns)
+    else:
+        columns = to_columns([result[1] for result in results])
+        df = to_frame(columns)
+        if printing:
+            print(df.groupby('model').mean(numeric_only=True))
+            print("experiment done")
     # generate the file
     if output_report:
         out = 'reports/'
-        pd.DataFrame(stats).to_csv(out + output, index=False)
-    return pd.DataFrame(stats)
+        save_results(columns, out + output)
+    return df if return_results else None
+
+
+EXACT_T_DF = 30          # below this many degrees of freedom, t quantiles are computed from the exact distribution
+
+
+def t_cdf(t, df):
+    """Distribution function of Student's t distribution with an integer number of degrees of freedom, from the
+    closed form of Abramowitz & Stegun 26.7.3-4"""
+    theta = math.atan(abs(t) / math.sqrt(df))
+    c2 = math.cos(theta)**2
+    if df % 2:      # odd: (2/pi) (theta + sin cos (1 + 2/3 cos^2 + 2.4/(3.5) cos^4 + ...))
+        term, total = 1.0, 1.0 if df > 1 else 0.0
+        for k in range(1, (df - 1) // 2):
+            term *= c2 * 2*k / (2*k + 1)
+            total += term
+        central = 2 / math.pi * (theta + math.sin(theta) * math.cos(theta) * total)
+    else:           # even: sin (1 + 1/2 cos^2 + 1.3/(2.4) cos^4 + ...)
+        term, total = 1.0, 1.0
+        for k in range(1, df // 2):
+            term *= c2 * (2*k - 1) / (2*k)
+            total += term
+        central = math.sin(theta) * total
+    return 0.5 + central/2 if t >= 0 else 0.5 - central/2
+
+
+def t_quantile(p, df):
+    """Quantile of Student's t distribution
+
+    Small numbers of degrees of freedom (the first checks of the sequential stopping rule) invert the exact
+    distribution function by bisection; the Cornish-Fisher expansion around the normal quantile is only used
+    from EXACT_T_DF on, where it is accurate to four digits.
+    """
+    if df < EXACT_T_DF and df == int(df):
+        if p < 0.5:
+            return -t_quantile(1 - p, df)
+        low, high = 0.0, 1.0
+        while t_cdf(high, int(df)) < p:
+            low, high = high, 2 * high
+        for _ in range(100):
+            middle = (low + high) / 2
+            if t_cdf(middle, int(df)) < p:
+                low = middle
+            else:
+                high = middle
+            if high - low <= 1e-12 * high:
+                break
+        return (low + high) / 2
+    z = NormalDist().inv_cdf(p)
+    g1 = (z**3 + z) / 4
+    g2 = (5*z**5 + 16*z**3 + 3*z) / 96
+    g3 = (3*z**7 + 19*z**5 + 17*z**3 - 15*z) / 384
+    g4 = (79*z**9 + 776*z**7 + 1482*z**5 - 1920*z**3 - 945*z) / 92160
+    return z + g1/df + g2/df**2 + g3/df**3 + g4/df**4
+
+
+def metric_values(stats, metric):
+    """Value of a metric in each replication. A metric is a stat name (e.g. 'total dead people') or a
+    pattern contained in several stat names (e.g. 'waiting time total'), which are then averaged"""
+    names = [metric] if metric in stats[0] else \
+        sorted({name for row in stats for name in row if metric in name and np.ndim(row[name]) == 0})
+    if not names:
+        raise KeyError('no stat matches metric {!r}'.format(metric))
+    return np.array([np.nanmean([row.get(name, np.nan) for name in names]) for row in stats])
+
+
+def precision(stats, metric, confidence=0.95):
+    """Mean, confidence-interval half-width and relative half-width of a metric over replications"""
+    values = metric_values(stats, metric)
+    mean = values.mean()
+    half_width = t_quantile(0.5 + confidence/2, len(values) - 1) * values.std(ddof=1) / np.sqrt(len(values))
+    relative = half_width / abs(mean) if mean else (0 if half_width == 0 else np.inf)
+    return mean, half_width, relative
+
+
+def sequential_experiment(models, max_time, metrics, target=0.05, confidence=0.95, min_replications=10,
+                          max_replications=100, batch=10, output_report=False, output='reports.npz', debug=False,
+                          printing=True, seed=None, common_random_numbers=False, workers=None, chunksize=None):
+    """ Run replications of each model in batches until the metrics reach a target precision
+    Args:
+        models (list) : list of map objects, or of ModelSpecs
+        max_time (int) : duration time for each simulation
+        metrics (list) : stat names or patterns (e.g. 'waiting time total', 'total dead people') whose
+            confidence intervals must reach the target precision
+        target (float) : target relative half-width of the confidence intervals (e.g. 0.05 for +/- 5%)
+        confidence (float) : confidence level of the intervals
+        min_replications (int) : number of replications run before the stopping rule is first checked (>= 3)
+        max_replications (int) : number of replications after which a model stops regardless of precision
+        batch (int) : number of replications added per model between checks of the stopping rule
+        (remaining arguments as in experiment)
+    Returns:
+        (DataFrame of the stats of every replication, DataFrame of the achieved precision per model and metric)
+    """
+    assert(all(isinstance(model, (Map, ModelSpec)) for model in models)), \
+        "models must be a list of Map objects or ModelSpecs"
+    assert(3 <= min_replications <= max_replications), "need 3 <= min_replications <= max_replications"
+    root = np.random.SeedSequence(seed)
+    stats = {i: [] for i in range(len(models))}     # model index -> list of stats dicts
+    achieved = []
+    active = list(enumerate(models))
+    done = 0
+    while active:
+        # all active models have run the same number of replications
+        n = min(max_replications, min_replications if done == 0 else done + batch)
+        for i, result in replicate(active, max_time, range(done, n), root, common_random_numbers, debug=debug,
+                                   workers=workers, chunksize=chunksize):
+            stats[i].append(result)
+        done = n
+
+        still_active = []
+        for i, m in active:
+            report = [(metric,) + precision(stats[i], metric, confidence) for metric in metrics]
+            converged = all(relative <= target for _, _, _, relative in report)
+            if converged or done >= max_replications:
+                achieved += [{'model': m.name, 'metric': metric, 'replications': done, 'mean': mean,
+                              'half width': half_width, 'relative half width': relative,
+                              'converged': relative <= target}
+                             for metric, mean, half_width, relative in report]
+            else:
+                still_active.append((i, m))
+        active = still_active
+        if printing:
+            print("{} replications run; {} models still running".format(done, len(active)))
+
+    columns = to_columns([result for i in range(len(models)) for result in stats[i]])
+    df = to_frame(columns)
+    achieved = pd.DataFrame(achieved)
+    if printing:
+        print(achieved)
+    if output_report:
+        save_results(columns, 'reports/' + output)
+    return df, achieved
 
 
 if __name__ == '__main__':
@@ -175,4 +440,4 @@ if __name__ == '__main__':
     model = [model1, model2, model3, model4]
 
     # run experiment!
-    experiment(model, ITERATION, 30, output_report=True, output='out.csv')
+    experiment(model, ITERATION, 30, output_report=True, output='out.npz')
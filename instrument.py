@@ -0,0 +1,135 @@
+import json
+from collections import defaultdict
+from time import perf_counter
+
+
+class MethodWrappers:
+    """ Wrappers set on the methods of instances for the duration of a run, and removed afterwards.
+
+    Each wrapper is an instance attribute that shadows the method of the class (or a wrapper set earlier), so
+    restoring the previous attribute, or deleting the wrapper, removes it without touching the class. Used by
+    Instrumentation and event_trace.TraceRecorder.
+    """
+    def __init__(self):
+        self.patched = []       # (object, attribute, previous instance attribute or None) of every wrapper
+
+    def wrap(self, obj, attr, wrapper):
+        """Set a wrapper of a method on an instance, remembering what it replaces"""
+        self.patched.append((obj, attr, obj.__dict__.get(attr)))
+        setattr(obj, attr, wrapper)
+
+    def remove(self):
+        """Remove every wrapper, most recent first"""
+        for obj, attr, previous in reversed(self.patched):
+            if previous is None:
+                delattr(obj, attr)
+            else:
+                setattr(obj, attr, previous)
+        self.patched = []
+
+
+class Instrumentation:
+    """ Opt-in profiling of one or more runs of Map.simulate.
+
+    Passed to Map.simulate(instrument=...), it wraps the hot-path methods of that map's objects for the duration
+    of the run: Bus.board, Bus.arrive, Bus.depart, BusStop.update, the updates of the time-weighted statistics
+    and the pop of the event list. The wrappers are set on the instances and removed when the run ends, so the
+    engine itself contains no instrumentation code and an uninstrumented run costs nothing extra.
+
+    Times are inclusive: e.g. the time of Bus.depart includes the time of the Bus.board calls it makes.
+
+    Args:
+        sample_every (int) : sample the event-list length and waiting counts every this many events
+        timeline (bool) : if true, also keep every timed call for export as a Chrome trace (memory grows with the
+            number of calls)
+    """
+    def __init__(self, sample_every=10, timeline=False):
+        self.sample_every = sample_every
+        self.timeline = timeline
+        self.event_counts = defaultdict(int)    # event type -> number of events popped
+        self.calls = defaultdict(int)           # method -> number of calls
+        self.times = defaultdict(float)         # method -> total wall time (s)
+        self.spans = []                         # (method, start, duration) of every call, if timeline
+        self.samples = []                       # (wall time, simulation time, event-list length, {stop: waiting})
+        self.origin = perf_counter()            # wall time of the start of the timeline
+        self._wrappers = MethodWrappers()       # wrappers set on the map's objects during a run
+
+    def _timed(self, name, method):
+        """Wrap a bound method so that its calls are counted and timed under a given name"""
+        calls, times = self.calls, self.times
+        spans = self.spans if self.timeline else None
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                duration = perf_counter() - start
+                calls[name] += 1
+                times[name] += duration
+                if spans is not None:
+                    spans.append((name, start, duration))
+        return timed
+
+    def attach(self, m):
+        """Wrap the methods of a map's buses, stops, statistics and event list (called by Map.simulate)"""
+        wrap = self._wrappers.wrap
+        for bus in m.buses:
+            for attr in ('board', 'arrive', 'depart'):
+                wrap(bus, attr, self._timed('Bus.' + attr, getattr(bus, attr)))
+            for stat in (bus.occupancy_stat, bus.standing_stat):
+                wrap(stat, 'update', self._timed('statistics', stat.update))
+        stops = list(m.bus_stops.values())
+        for stop in stops:
+            wrap(stop, 'update', self._timed('BusStop.update', stop.update))
+            wrap(stop.waiting_stat, 'update', self._timed('statistics', stop.waiting_stat.update))
+
+        queue = m.event_queue
+        pop = queue.pop
+        counts, samples, every = self.event_counts, self.samples, self.sample_every
+        popped = [0]
+
+        def counted_pop():
+            event = pop()
+            counts[event.type] += 1
+            popped[0] += 1
+            if popped[0] % every == 0:
+                samples.append((perf_counter(), event.time, len(queue),
+                                {stop.name: stop.num_waiting for stop in stops}))
+            return event
+        wrap(queue, 'pop', self._timed('event list', counted_pop))
+
+    def detach(self):
+        """Remove every wrapper (called by Map.simulate at the end of the run)"""
+        self._wrappers.remove()
+
+    def summary(self):
+        """DataFrame with the number of calls, total time (ms) and mean time (us) of every instrumented method"""
+        import pandas as pd
+        rows = {name: {'calls': self.calls[name], 'total (ms)': 1e3 * self.times[name],
+                       'mean (us)': 1e6 * self.times[name] / self.calls[name]} for name in self.calls}
+        return pd.DataFrame.from_dict(rows, orient='index').sort_values('total (ms)', ascending=False)
+
+    def to_json(self, path):
+        """Save the event counts, method times and samples as JSON"""
+        with open(path, 'w') as f:
+            json.dump({'events': dict(self.event_counts),
+                       'methods': {name: {'calls': self.calls[name], 'seconds': self.times[name]}
+                                   for name in self.calls},
+                       'samples': [{'wall': wall - self.origin, 'time': time, 'event list': length,
+                                    'waiting': waiting} for wall, time, length, waiting in self.samples]}, f)
+
+    def to_chrome_trace(self, path):
+        """Save the timeline in the Chrome trace format (open in chrome://tracing or Perfetto)
+
+        Timed calls (if timeline) become complete events; samples become counters of the event-list length
+        and of the people waiting at each stop.
+        """
+        events = [{'name': name, 'ph': 'X', 'pid': 0, 'tid': 0, 'ts': 1e6 * (start - self.origin),
+                   'dur': 1e6 * duration} for name, start, duration in self.spans]
+        for wall, time, length, waiting in self.samples:
+            ts = 1e6 * (wall - self.origin)
+            events.append({'name': 'event list', 'ph': 'C', 'pid': 0, 'ts': ts, 'args': {'length': length}})
+            events.append({'name': 'people waiting', 'ph': 'C', 'pid': 0, 'ts': ts, 'args': waiting})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
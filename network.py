@@ -0,0 +1,82 @@
+import numpy as np
+
+SPEED = 20                  # average driving speed on short legs (km/hr)
+LONG_LEG = 2                # legs at least this long (km) have a random driving time
+LONG_LEG_TIME = (5, 7)      # driving time of a long leg is uniform over this range (minutes)
+
+
+class Network:
+    """ Integer-indexed tables of a set of routes, compiled once so the engine never searches object lists or dicts.
+
+    Routes are indexed by their position in the list of routes and stops by BusStop.id. Every table is a NumPy
+    array for vectorized use; the tables used per event also have nested-list mirrors (legs, times, spreads,
+    switches, switch_positions), since indexing lists is faster than indexing arrays one element at a time.
+
+    Attributes:
+        routes (list): Route objects, indexed by route index.
+        route_index (dict): Route number -> route index.
+        stop_sequence (np.ndarray): (route, position) -> stop id of each stop of each route; -1 past its end.
+        leg_distance (np.ndarray): (route, leg) -> distance (km) from stop position leg to leg + 1; NaN past the end.
+        leg_time (np.ndarray): (route, leg) -> minimum driving time of the leg (minutes).
+        leg_spread (np.ndarray): (route, leg) -> width of the range of the driving time (0 for deterministic legs);
+            the driving time is leg_time + leg_spread * u for u uniform on [0, 1).
+        stop_mask (np.ndarray): (route, stop) -> whether the route stops at the stop.
+        switch_distance (np.ndarray): (from route, to route, stop) -> distance to drive, once the change is
+            requested with the stop as the next stop, before the bus switches route; NaN if not allowed.
+        switch_next (np.ndarray): (from route, to route, stop) -> stop position in the new route after the
+            switch; -1 if not allowed.
+
+    Args:
+        routes (list): Route objects
+        num_stops (int): number of stops (ids) in the map
+
+    """
+    def __init__(self, routes, num_stops):
+        self.routes = list(routes)
+        self.route_index = {route.num: i for i, route in enumerate(self.routes)}
+        num_routes = len(self.routes)
+        length = max(len(route.stops) for route in self.routes)
+
+        self.stop_sequence = np.full((num_routes, length), -1, dtype=np.intp)
+        self.leg_distance = np.full((num_routes, length - 1), np.nan)
+        self.stop_mask = np.zeros((num_routes, num_stops), dtype=bool)
+        self.switch_distance = np.full((num_routes, num_routes, num_stops), np.nan)
+        self.switch_next = np.full((num_routes, num_routes, num_stops), -1, dtype=np.intp)
+
+        for i, route in enumerate(self.routes):
+            stop_ids = [stop.id for stop in route.stops]
+            self.stop_sequence[i, :len(stop_ids)] = stop_ids
+            self.leg_distance[i, :len(route.distances)] = route.distances
+            self.stop_mask[i, stop_ids] = True
+            for number, points in route.switch_points.items():
+                j = self.route_index[number]
+                for stop, (distance, position) in points.items():
+                    self.switch_distance[i, j, stop.id] = distance
+                    self.switch_next[i, j, stop.id] = position
+
+        # short legs are driven at the average speed, long legs take a uniformly distributed time
+        long_legs = self.leg_distance >= LONG_LEG
+        self.leg_time = np.where(long_legs, LONG_LEG_TIME[0], (self.leg_distance / SPEED) * 60)
+        self.leg_spread = np.where(long_legs, LONG_LEG_TIME[1] - LONG_LEG_TIME[0], 0.0)
+
+        # list mirrors for the hot path
+        self.legs = self.leg_distance.tolist()
+        self.times = self.leg_time.tolist()
+        self.spreads = self.leg_spread.tolist()
+        self.switches = self.switch_distance.tolist()
+        self.switch_positions = self.switch_next.tolist()
+
+        for i, route in enumerate(self.routes):
+            route.index = i
+            route.stop_mask = self.stop_mask[i]
+            route.serves = route.stop_mask.tolist()
+
+    def switch(self, route, to_route, stop):
+        """[distance to drive before switching, stop position in the new route] for a route change requested
+        while heading to a stop. Raises KeyError if the switch is not possible there."""
+        i, j, k = route.index, to_route.index, stop.id
+        position = self.switch_positions[i][j][k]
+        if position < 0:
+            raise KeyError('cannot switch from route {} to route {} before {}'.format(route.num, to_route.num,
+                                                                                     stop.name))
+        return [self.switches[i][j][k], position]
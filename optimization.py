@@ -1,6 +1,11 @@
-import pysmac
 import pickle
-from experiment import create_map, experiment
+import evaluation
+from evaluation import EvaluationCache, evaluate
+
+# evaluations are cached on disk, so revisited schedules and the different objectives reuse the same replications
+CACHE = EvaluationCache('results/cache')
+# fixed root seed: every schedule is simulated with the same random numbers, which makes them comparable
+SEED = 2017
 
 
 def save_obj(obj, name):
@@ -27,8 +32,7 @@ def generate_simulation_result(x21, x22, x23, x24, x25, x26,
     b6 = [x61, x62, x63, x64, x65, x66]
     b7 = [x71, x72, x73, x74, x75, x76]
 
-    model = create_map(routes_per_bus=[b1, b2, b3, b4, b5, b6, b7], name='model')
-    return experiment([model], 60*18, 10, output_report=False, printing=False)
+    return evaluate([b1, b2, b3, b4, b5, b6, b7], 60*18, 10, seed=SEED, cache=CACHE)
 
 
 def avg_waiting_time(x21, x22, x23, x24, x25, x26,
@@ -44,7 +48,7 @@ def avg_waiting_time(x21, x22, x23, x24, x25, x26,
                                        x51, x52, x53, x54, x55, x56,
                                        x61, x62, x63, x64, x65, x66,
                                        x71, x72, x73, x74, x75, x76)
-    return stats[stats.keys()[stats.keys().str.contains('waiting time total')]].mean().values.mean()
+    return evaluation.avg_waiting_time(stats)
 
 
 def avg_queue_length(x21, x22, x23, x24, x25, x26,
@@ -60,7 +64,7 @@ def avg_queue_length(x21, x22, x23, x24, x25, x26,
                                        x51, x52, x53, x54, x55, x56,
                                        x61, x62, x63, x64, x65, x66,
                                        x71, x72, x73, x74, x75, x76)
-    return stats[stats.keys()[stats.keys().str.contains('avg people waiting') & ~stats.keys().str.contains('Depot') & ~stats.keys().str.contains('Wegmans-Westbound')]].mean().values.mean()
+    return evaluation.avg_queue_length(stats)
 
 
 def avg_occupancy(x21, x22, x23, x24, x25, x26,
@@ -76,7 +80,7 @@ def avg_occupancy(x21, x22, x23, x24, x25, x26,
                                        x51, x52, x53, x54, x55, x56,
                                        x61, x62, x63, x64, x65, x66,
                                        x71, x72, x73, x74, x75, x76)
-    return stats[stats.keys()[stats.keys().str.contains('avg occupancy') & stats.keys().str.contains('Bus')]].mean().values.mean()
+    return evaluation.avg_occupancy(stats)
 
 
 def dead_people(x21, x22, x23, x24, x25, x26,
@@ -92,10 +96,11 @@ def dead_people(x21, x22, x23, x24, x25, x26,
                                        x51, x52, x53, x54, x55, x56,
                                        x61, x62, x63, x64, x65, x66,
                                        x71, x72, x73, x74, x75, x76)
-    return stats['total dead people'].values.mean()
+    return evaluation.dead_people(stats)
 
 
 if __name__ == "__main__":
+    import pysmac   # only needed to run SMAC; see schedule_search.py for a dependency-free optimizer
 
     parameters = dict(
 
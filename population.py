@@ -0,0 +1,61 @@
+import numpy as np
+
+# state codes of a rider
+WAITING = 0
+RIDING = 1
+ARRIVED = 2
+STATES = ('waiting', 'riding', 'arrived')
+
+
+class Population:
+    """ Compact struct-of-arrays store of every rider in one simulation run.
+
+    Riders are addressed by integer id. Columns are preallocated once the arrival streams of all bus stops
+    are known, so no per-rider objects are created while the simulation runs. The riders arriving at a
+    stop occupy a contiguous block of ids in order of arrival, starting at BusStop.first_id.
+
+    Attributes:
+        stops (list): BusStop objects, indexed by stop id.
+        origin (np.ndarray): Stop id of the bus stop where each rider starts.
+        destination (np.ndarray): Stop id of the bus stop each rider is trying to get to.
+        start_time (np.ndarray): Time at which each rider arrived at the origin bus stop.
+        board_time (np.ndarray): Time at which each rider boarded a bus (NaN until boarded).
+        state (np.ndarray): State code of each rider: WAITING, RIDING or ARRIVED.
+
+    """
+    def __init__(self, size, stops=()):
+        id_type = np.int16 if len(stops) < np.iinfo(np.int16).max else np.int32
+        self.stops = list(stops)
+        self.origin = np.zeros(size, dtype=id_type)
+        self.destination = np.zeros(size, dtype=id_type)
+        self.start_time = np.zeros(size)
+        self.board_time = np.full(size, np.nan)
+        self.state = np.full(size, WAITING, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.start_time)
+
+    @classmethod
+    def from_stops(cls, stops):
+        """Build the store from the generated arrival streams of a list of bus stops
+        Args:
+            stops (list) : list of BusStop objects whose ids index this list
+        """
+        population = cls(sum(len(stop.arrival_times) for stop in stops), stops)
+        first_id = 0
+        for stop in stops:
+            last_id = first_id + len(stop.arrival_times)
+            dest_ids = np.array([dest.id for dest in stop.destinations], dtype=population.destination.dtype)
+            population.origin[first_id:last_id] = stop.id
+            population.destination[first_id:last_id] = dest_ids[stop.arrival_dests]
+            population.start_time[first_id:last_id] = stop.arrival_times
+            stop.population = population
+            stop.first_id = first_id
+            first_id = last_id
+        return population
+
+    @property
+    def nbytes(self):
+        """Number of bytes used by the columns of this store"""
+        return sum(column.nbytes for column in (self.origin, self.destination, self.start_time,
+                                                self.board_time, self.state))
@@ -1,18 +1,27 @@
 import numpy as np
-import pygame
-import datetime
+import heapq
+from collections import defaultdict, deque, namedtuple
 from time import sleep
 from arrival import generate_arrival
-import re
+from event_list import make_event_list
+from population import Population, RIDING, ARRIVED, STATES
+from streams import RandomStreams, VariateBuffer
+from accumulator import TimeWeighted
+from network import Network
 from time import time as tf
 
 
-class Event:
-    def __init__(self, time, bus, bus_stop, event_type):
-        self.time = time            # time at which the event occurs
-        self.bus = bus              # bus object
-        self.bus_stop = bus_stop    # the event location of the bus object
-        self.type = event_type      # either 'departure' or 'arrival'
+class Event(namedtuple('Event', ['time', 'bus', 'bus_stop', 'type'])):
+    """ Lightweight (tuple-based) record of a discrete event.
+
+    Attributes:
+        time (float): Time at which the event occurs.
+        bus (Bus): Bus object.
+        bus_stop (BusStop): The event location of the bus object.
+        type (str): Either 'departure' or 'arrival'.
+
+    """
+    __slots__ = ()
 
     def print_event(self):
         """ when the simulation is DEBUG mode, print the event on console """
@@ -20,28 +29,57 @@ class Event:
 
 
 class Map:
-    def __init__(self, routes, buses, bus_stops, name='Ithaca'):
+    def __init__(self, routes, buses, bus_stops, name='Ithaca', event_list='heap'):
         self.name = name                    # name of this map
         self.routes = routes                # list of Route objects that the map provides
         self.buses = buses                  # list of Bus objects in this map
         self.bus_stops = bus_stops          # list of BusStop objects
-        self.event_queue = []               # an event queue to manage discrete simulation
+        self.population = None              # Population store of the riders in the current run
+        self.streams = None                 # RandomStreams of the current run
+        self.event_list = event_list        # kind of future event list: 'heap' or 'calendar'
+        self.event_queue = make_event_list(event_list)  # an event queue to manage discrete simulation
         self.prev_time = 0                  # keep track of previous event time
-        self.surface = None
+        self.renderer = None                # Renderer of the animation, created by simulate(animate=True)
         self.path_occupancy = {}            # origin -> destination -> list of occupancy
         self.path_travel = {}               # origin -> destination -> list of travels
         self.total_dead = 0
+        self.num_events = 0                 # number of events processed in the last run
+        self.run_time = 0                   # wall-clock time (in seconds) of the main loop of the last run
+
+        for stop_id, bus_stop in enumerate(self.bus_stops.values()):
+            bus_stop.id = stop_id           # stops are addressed by integer id in the Population store
+        self.network = Network(self.routes, len(self.bus_stops))   # integer-indexed tables of the routes
+        for bus in self.buses:
+            bus.network = self.network
 
-    def simulate(self, max_time, debug=False, animate=False, **settings):
+    def simulate(self, max_time, debug=False, animate=False, seed=None, instrument=None, trace=None, **settings):
         """Run simulation of this map
         Args:
             max_time (float): number of minutes for which to run the simulation
             debug (boolean): whether or not to run the simulation in debug mode
             animate(boolean): whether or not to render an animation of the simulation
+            seed (int or SeedSequence): seed of the random streams; runs with equal seeds see identical arrival,
+                boarding-time and driving-time streams. None draws fresh entropy
+            instrument (Instrumentation): if given, profiles the hot path of this run (see instrument.py)
+            trace (TraceRecorder): if given, records every event of this run to a binary file (see event_trace.py)
             **settings: keyword-arguments specifying settings of the animation
         """
-        time = 0
+        # time-weighted statistics, kept in half-hour bins and updated only when a level changes
+        for bus in self.buses:
+            bus.occupancy_stat = TimeWeighted(max_time, 30, level=bus.occupancy)
+            bus.standing_stat = TimeWeighted(max_time, level=bus.num_standing)
+        for bus_stop in self.bus_stops.values():
+            bus_stop.waiting_stat = TimeWeighted(max_time, 30, level=bus_stop.num_waiting)
+
+        # one random stream per purpose and entity; per-event variates are served from pre-drawn buffers
+        self.streams = RandomStreams(seed)
+        for bus in self.buses:
+            bus.driving_times = self.streams.buffer('driving', bus.name, 'uniform', (0, 1), block_size=256)
+        for bus_stop in self.bus_stops.values():
+            bus_stop.boarding_times = self.streams.buffer('boarding', bus_stop.name, 'triangular', (0, 1/60, 5/60))
+
         # initialize the event queue
+        self.event_queue.clear()
         for i, bus in enumerate(self.buses):
             if bus.route == self.routes[1]:         # buses on Route 2 must start at depot, then change
                 bus.route = self.routes[0]
@@ -51,18 +89,47 @@ class Map:
 
             # TODO: implement better staggered departures
             if bus.route == self.routes[0]:
-                self.event_queue.append(Event(1, bus, self.bus_stops['TDOG Depot'], 'departure'))
+                self.event_queue.push(1, Event(1, bus, self.bus_stops['TDOG Depot'], 'departure'))
             else:
-                self.event_queue.append(Event(0, bus, self.bus_stops['TDOG Depot'], 'departure'))
+                self.event_queue.push(0, Event(0, bus, self.bus_stops['TDOG Depot'], 'departure'))
 
         # draw bus stop (if animate) and generate new data
+        if animate and (self.renderer is None or self.renderer.surface is not settings['surface']):
+            from renderer import Renderer   # pygame is only loaded for animated runs
+            self.renderer = Renderer(settings['surface'])   # reused across runs, so images are loaded once
         for bus_stop in self.bus_stops.values():
-            bus_stop.generate_data(max_time)
+            bus_stop.generate_data(max_time, self.streams)
             if animate:
-                self.surface = settings['surface']
-                bus_stop.add_animation(settings['surface'], settings['coordinates'][bus_stop.name])
+                bus_stop.add_animation(self.renderer, settings['coordinates'][bus_stop.name])
+
+        # preallocate the store of every rider generated for this run
+        self.population = Population.from_stops(list(self.bus_stops.values()))
+        for bus in self.buses:
+            bus.population = self.population
 
         # main loop
+        if instrument is not None:
+            instrument.attach(self)
+        try:
+            if trace is not None:
+                trace.attach(self)
+            self.run_events(max_time, debug, animate)
+        finally:
+            # also when the run fails, so no wrappers are left behind and the events so far are written
+            try:
+                if trace is not None:
+                    trace.detach()          # attached last, so removed first
+            finally:
+                if instrument is not None:
+                    instrument.detach()
+        print('Simulation complete')
+        print("Simulation Time : ", self.run_time)
+
+    def run_events(self, max_time, debug=False, animate=False):
+        """Main loop of simulate: process events until max_time, then flush the statistics to the end of the run"""
+        time = 0
+        num_bins = int(np.ceil(max_time / 30))  # number of half-hour bins of the time-series stats
+        self.num_events = 0
         start = tf()
         while time < max_time:
             if debug:                                                       # wait for user input to proceed
@@ -73,15 +140,13 @@ class Map:
                         print('tracker:', bus.change_tracker)
 
             if animate:
-                self.update_clock(settings['surface'], time)
+                self.update_clock(time)
                 for bus_stop in self.bus_stops.values():
                     bus_stop.update(time)                                   # fine-grained animation (much slower)
+                self.renderer.present()                                     # redraw only what changed
 
-            sorted_queue = sorted(self.event_queue, key=lambda x: x.time)   # sort the event queue
-            self.event_queue = sorted_queue[1:]                             # shift the queue by 1
-            next_event = sorted_queue[0]                                    # get the next earliest event
+            next_event = self.event_queue.pop()                             # get the next earliest event
             time = next_event.time                                          # current event time
-            delta_time = time - self.prev_time                              # time - time_lst to calculate the integral
 
             hour = int(time / 30)                                           # update hour flag
             hour_3 = int(time / 180)                                        # update 3 hour flag
@@ -95,34 +160,14 @@ class Map:
             if debug:                                                       # print the event
                 next_event.print_event()
 
-            # update the utility
-            for b in self.buses:
-                b.avg_occupancy += delta_time * len(b.passengers)                       # average occupancy of each bus
-                b.avg_standing += delta_time * max(len(b.passengers) - b.num_seats, 0)  # average people standing for each bus
-                if hour not in b.avg_occupancy_t.keys():
-                    b.avg_occupancy_t[hour] = 0
-                else:
-                    b.avg_occupancy_t[hour] += delta_time * len(b.passengers)
-
-            for bs in self.bus_stops.keys():
-                bs = self.bus_stops[bs]
-                bs.avg_num_waiting += delta_time * bs.num_waiting                 # average people waiting at each stop
-
-            for bs in self.bus_stops.keys():                                      # average people waiting at each hour
-                bs = self.bus_stops[bs]
-                if hour not in bs.avg_num_waiting_t.keys():
-                    bs.avg_num_waiting_t[hour] = 0
-
-                else:
-                    bs.avg_num_waiting_t[hour] += delta_time * bs.num_waiting_hr
-
             if time > max_time:
                 break
+            self.num_events += 1
 
             # process arrival event
             if next_event.type == "arrival":
                 dpt_event = next_event.bus.arrive(next_event.bus_stop, next_event.time, debug=debug)
-                self.event_queue.append(dpt_event)
+                self.event_queue.push(dpt_event.time, dpt_event)
 
             # process departure event
             else:
@@ -133,7 +178,7 @@ class Map:
                     delay = 2
 
                 arv_event = next_event.bus.depart(next_event.bus_stop, next_event.time, time + delay)
-                self.event_queue.append(arv_event) # add arrival event to the queue
+                self.event_queue.push(arv_event.time, arv_event)  # add arrival event to the queue
 
                 # update the stats between paths every time the buses depart
                 if next_event.bus_stop.name != arv_event.bus_stop.name:
@@ -141,8 +186,8 @@ class Map:
                         self.path_occupancy[next_event.bus_stop.name] = {}
                         self.path_travel[next_event.bus_stop.name] = {}
                     if arv_event.bus_stop.name not in self.path_occupancy[next_event.bus_stop.name].keys():
-                        self.path_occupancy[next_event.bus_stop.name][arv_event.bus_stop.name] = [0] * int(max_time / 30) # stats are in the unit of 30min
-                        self.path_travel[next_event.bus_stop.name][arv_event.bus_stop.name] = [0] * int(max_time / 30)    # stats are in the unit of 30min
+                        self.path_occupancy[next_event.bus_stop.name][arv_event.bus_stop.name] = [0] * num_bins # stats are in the unit of 30min
+                        self.path_travel[next_event.bus_stop.name][arv_event.bus_stop.name] = [0] * num_bins    # stats are in the unit of 30min
 
                     self.path_occupancy[next_event.bus_stop.name][arv_event.bus_stop.name][hour] += next_event.bus.occupancy
                     self.path_travel[next_event.bus_stop.name][arv_event.bus_stop.name][hour] += 1
@@ -150,53 +195,42 @@ class Map:
             self.prev_time = time # update the last event time
             # end of one event cycle
 
-        # update the utility
+        # update the utility: flush the time-weighted statistics to the end of the run
         for b in self.buses:
-            b.avg_occupancy /= max_time
-            b.avg_standing /= max_time
-            waiting_t = np.array([value for (key, value) in sorted(b.avg_occupancy_t.items())])
-            b.avg_occupancy_t = waiting_t/30
+            b.occupancy_stat.flush(max_time)
+            b.standing_stat.flush(max_time)
+            b.avg_occupancy = b.occupancy_stat.mean()               # average occupancy of each bus
+            b.avg_standing = b.standing_stat.mean()                 # average people standing for each bus
+            b.avg_occupancy_t = b.occupancy_stat.bin_means()        # average occupancy of each bus per half-hour
             self.total_dead += b.dead_people
 
-        for bs in self.bus_stops.keys():
-            bs = self.bus_stops[bs]
-            bs.avg_num_waiting /= max_time
-            waiting_t = bs.avg_num_waiting_t
-            waiting_t = np.array([value for (key, value) in sorted(bs.avg_num_waiting_t.items())])
-            bs.avg_num_waiting_t = waiting_t/30
+        for bs in self.bus_stops.values():
+            bs.waiting_stat.flush(max_time)
+            bs.avg_num_waiting = bs.waiting_stat.mean()             # average people waiting at each stop
+            bs.avg_num_waiting_t = bs.waiting_stat.bin_means()      # average people waiting at each stop per half-hour
 
-        print('Simulation complete')
-        print("Simulation Time : ", tf() - start)
+        self.run_time = tf() - start
 
-    def update_clock(self, surface, elapsed):
+    def update_clock(self, elapsed):
         """Updated clock in bottom right corner of animation"""
-        width, height = 1080, 720
-        clear = pygame.image.load('images/blank.png')
-        clear_rect = clear.get_rect()
-        clear_rect.bottomright = (width, height)
-        surface.blit(clear, clear_rect)
-
-        font_med = pygame.font.SysFont("Helvetica", 15)
-        start = datetime.datetime(2017, 12, 1, 6, 0)
-        current = (start + datetime.timedelta(minutes=elapsed)).time()
-        clock = font_med.render('Time: ' + str(current)[:5], 1, (255, 255, 255))
-        surface.blit(clock, (width - 90, height - 30))
+        self.renderer.draw_clock(elapsed)
 
     def collect_stats(self):
-        """ Called after the simulation to collect the stats"""
+        """ Called after the simulation to collect the stats
+
+        Returns a dict of numeric stats: scalars, and float arrays of fixed length (one value per half-hour)
+        for the time-series stats whose names contain 'hourly'.
+        """
         stats = {}
         total_traveled = 0
 
         # stats for the occupancy rate between stops
         for origin in self.path_occupancy.keys():
             for dest in self.path_occupancy[origin].keys():
-                time = []
-                for i,j in zip(self.path_occupancy[origin][dest], self.path_travel[origin][dest]):
-                    if j == 0:
-                        time.append(0)
-                    else:
-                        time.append(i/j)
-                stats[origin + "-" + dest + " hourly occupancy"] = re.split("\[ |\]", str(np.array(time)[:-1]))[1]
+                occupancy = np.array(self.path_occupancy[origin][dest], dtype=float)
+                travel = np.array(self.path_travel[origin][dest], dtype=float)
+                time = np.divide(occupancy, travel, out=np.zeros_like(occupancy), where=travel != 0)
+                stats[origin + "-" + dest + " hourly occupancy"] = time
                 if sum(self.path_travel[origin][dest]) != 0:
                     stats[origin + "-" + dest + " avg occupancy"] = sum(self.path_occupancy[origin][dest])/sum(self.path_travel[origin][dest])
 
@@ -206,13 +240,13 @@ class Map:
             total_traveled += bus.distance                          # traveling distance for all buses
             stats[bus.name + " avg occupancy"] = bus.avg_occupancy  # average occupancy for each buses
             stats[bus.name + " avg standing"] = bus.avg_standing    # average number of people standing for each bus
-            stats[bus.name + " hourly occupancy"] = re.split("\[ |\]", str(bus.avg_occupancy_t[:-1]))[1]
+            stats[bus.name + " hourly occupancy"] = bus.avg_occupancy_t
 
         # stats for each bus stop
         for bs in self.bus_stops.keys():
             bs = self.bus_stops[bs]
             stats[bs.name + " avg people waiting"] = bs.avg_num_waiting  # avg. number of people waiting at each stop
-            stats[bs.name + " hourly people waiting"] = re.split("\[ |\]", str(bs.avg_num_waiting_t[:-1]))[1]
+            stats[bs.name + " hourly people waiting"] = bs.avg_num_waiting_t
             total_waiting = 0
             total_people = 0
             for dest in bs.waiting_time.keys():
@@ -232,6 +266,9 @@ class Map:
         """ reset simulation """
         self.prev_time = 0
         self.total_dead = 0
+        self.path_occupancy = {}
+        self.path_travel = {}
+        self.population = None      # release the riders of the last run; simulate generates new ones
         # reset the stats for each bus
         for bus in self.buses:
             bus.reset()
@@ -240,7 +277,9 @@ class Map:
             bus_stop.reset()
             if bus_stop.animate:
                 bus_stop.update(0)
-                self.update_clock(self.surface, 0)
+        if self.renderer is not None:
+            self.update_clock(0)
+            self.renderer.present()
 
 
 class Bus:
@@ -251,7 +290,8 @@ class Bus:
         next_stop_num (int): The stop number of the next stop this bus will stop at.
         next_stop (BusStop): A BusStop object denoting the next stop this bus will stop at.
 
-        passengers (list): A list of Person objects representing the passengers on this bus.
+        manifest (dict): Passengers on this bus bucketed by destination (key: BusStop, value: list of rider ids).
+        population (Population): Store of the riders in the current simulation run.
         occupancy (int): The number of people currently on this bus.
         num_seats(int): The number of seats on this bus.
         standing_cap(int): The number of people that can be standing on this bus.
@@ -266,6 +306,7 @@ class Bus:
 
         self.name = name
         self.route = route
+        self.start_route = route                       # route at the start of each simulation
         self.to_change = None                          # if current route is temporary, specify route to switch to
         self.change_tracker = [0, 0]                   # [distance travelled since checkpoint, distance to switch-point]
         self.schedule = schedule                       # list (e.g [1,1,1,1,2,2]) specifying route every 3 hrs
@@ -273,23 +314,50 @@ class Bus:
         self.next_stop_num = 1                             # bus starts at first stop, i.e. index 0
         self.next_stop = self.route.stops[1]
 
-        self.passengers = []                               # bus starts with nobody on it
+        self.manifest = defaultdict(list)                  # destination -> rider ids; bus starts with nobody on it
+        self.population = None                             # rider store, set by Map.simulate
         self.occupancy = 0
         self.num_seats = 25                                # default number of seats is 25
         self.standing_cap = 10                             # default standing capacity is 10
         self.max_cap = self.num_seats + self.standing_cap  # default total capacity is 25+10=35
 
+        self.driving_times = VariateBuffer(np.random.default_rng(), 'uniform', (0, 1), 256)  # set by Map.simulate
+        self.network = None                                # Network of the routes, set by the Map
+
         self.distance = 0                                  # distance travelled by this bus
         # TODO: other relevant performance metrics?
         self.avg_occupancy = 0
         self.avg_standing = 0
         self.dead_people = 0
-        self.avg_occupancy_t = {}                          # hour -> average occupancy dict
+        self.avg_occupancy_t = []                          # average occupancy per half-hour
+        self.occupancy_stat = TimeWeighted(0)              # time-weighted statistics, set by Map.simulate
+        self.standing_stat = TimeWeighted(0)
 
         self.animate = False
-        self.surface = None
+        self.renderer = None                               # Renderer of the animation
         self.icon = None
-        self.icon_rect = None,
+        self.icon_rect = None
+
+    @property
+    def passengers(self):
+        """List of Person views of all passengers currently on this bus (for debugging and animation)"""
+        return [Person(self.population, rider) for riders in self.manifest.values() for rider in riders]
+
+    @property
+    def num_sitting(self):
+        """Number of passengers sitting: the first num_seats passengers (or all, if fewer) sit down"""
+        return min(self.occupancy, self.num_seats)
+
+    @property
+    def num_standing(self):
+        """Number of passengers standing"""
+        return max(self.occupancy - self.num_seats, 0)
+
+    def record_occupancy(self, time):
+        """Report a change in occupancy at a given time to the time-weighted statistics"""
+        self.occupancy_stat.update(time, self.occupancy)
+        if self.standing_stat.level or self.occupancy > self.num_seats:    # standing count changed
+            self.standing_stat.update(time, self.num_standing)
 
     def goes_to(self, stop):
         """Returns True if this bus goes to the specified stop and False otherwise"""
@@ -297,16 +365,16 @@ class Bus:
         assert(isinstance(stop, BusStop)), "stop must be a BusStop"
 
         if isinstance(self.to_change, Route):
-            return stop in self.to_change.stops
+            return self.to_change.serves[stop.id]
         else:
-            return stop in self.route.stops
+            return self.route.serves[stop.id]
 
     def request_route_change(self, route):
         """Make a request to change the route: may or may not be executed instantaneously"""
         if self.route == route:
             return
         self.to_change = route
-        self.change_tracker[1:] = self.route.switch_points[route.num][self.next_stop]
+        self.change_tracker[1:] = self.network.switch(self.route, route, self.next_stop)
 
     def execute_route_change(self):
         """Execute route change"""
@@ -323,31 +391,38 @@ class Bus:
     def board(self, stop, time):
         """Models the process of people boarding this bus at a certain stop"""
         # people waiting at bus stop will get on if bus goes to desired destination and there is space on the bus
-        n = stop.update(time)
+        stop.update(time)
         boarding_time = time
-        count = 0
-        people_just_arrived = stop.people_waiting[-n:]
-        hour = int(time / 30)
-        for person in stop.people_waiting[:]:
-            count += 1
-            if self.occupancy == self.max_cap:
-                break
-            if self.goes_to(person.destination):
-                self.passengers.append(person)
-                self.occupancy += 1
-                stop.people_waiting.remove(person)
-                stop.num_waiting -= 1
-                stop.num_waiting_hr -= 1
-                person.waiting_time = boarding_time - person.start_time  # record waiting time
-                if person.waiting_time > 120:
-                    self.dead_people += 1
-                person.origin.add_waiting_time(person.destination, person.waiting_time) # update the origin waiting time
-                boarding_time += np.random.triangular(0, 1/60, 5/60)   # boarding times have triangular distribution
-                stop.update(boarding_time)  # people arrive while bus is boarding
-                person.state = 'standing'
-                if person in people_just_arrived:
-                    stop.avg_num_waiting += person.waiting_time
-                    stop.avg_num_waiting_t[hour] += person.waiting_time
+        population = stop.population
+
+        # only queues of destinations this bus serves are considered; people arriving while the bus is
+        # boarding join the back of the queues and are left for the next boarding pass
+        serves = self.to_change.serves if isinstance(self.to_change, Route) else self.route.serves
+        groups = [[queue, len(queue), destination] for destination, queue in stop.queues.items()
+                  if queue and serves[destination.id]]
+        while groups and self.occupancy < self.max_cap:
+            # board in order of arrival across the destination groups
+            # (ids at a stop are assigned in order of arrival)
+            group = groups[0] if len(groups) == 1 else min(groups, key=lambda g: g[0][0])
+            queue, destination = group[0], group[2]
+            rider = queue.popleft()
+            group[1] -= 1
+            if group[1] == 0:
+                groups.remove(group)
+
+            self.manifest[destination].append(rider)
+            self.occupancy += 1
+            self.record_occupancy(boarding_time)
+            stop.num_waiting -= 1
+            stop.waiting_stat.update(boarding_time, stop.num_waiting)
+            waiting_time = boarding_time - population.start_time.item(rider)  # record waiting time
+            if waiting_time > 120:
+                self.dead_people += 1
+            stop.add_waiting_time(destination, waiting_time)   # update the origin waiting time
+            population.board_time[rider] = boarding_time
+            population.state[rider] = RIDING
+            boarding_time += stop.boarding_times.draw()   # boarding times have triangular distribution (0, 1/60, 5/60)
+            stop.update(boarding_time)  # people arrive while bus is boarding
 
         return boarding_time
 
@@ -362,15 +437,13 @@ class Bus:
         if not changed:
             self.next_stop_num = self.next_stop_num % (len(self.route.stops) - 1) + 1    # update next stop number
             self.next_stop = self.route.stops[self.next_stop_num]
-        before = len(self.passengers)
-
         # if current stop is destination, passenger will get off
-        for person in self.passengers[:]:
-            if person.destination == stop:
-                self.passengers.remove(person)
-                self.occupancy -= 1
-                # TODO: add time taken for people to get off?
-                person.state = 'arrived'
+        alighting = self.manifest.pop(stop, ())
+        # TODO: add time taken for people to get off?
+        if alighting:
+            self.occupancy -= len(alighting)
+            self.record_occupancy(time)
+            self.population.state[alighting] = ARRIVED
 
         if debug:
             print('After arrival, occupancy =', self.occupancy)
@@ -380,50 +453,52 @@ class Bus:
     def depart(self, stop, time, earliest_depart):
         """Models a bus driving from one stop to another"""
 
-        distance_travelled = self.route.distances[self.next_stop_num - 1]
+        # leg into the next stop; a next stop number of 0 (the loop's start) means the route's last leg
+        network, route = self.network, self.route.index
+        leg = (self.next_stop_num - 1) % len(self.route.distances)
+        distance_travelled = network.legs[route][leg]
         self.distance += distance_travelled                # add distance travelled by bus
         if isinstance(self.to_change, Route):
             self.change_tracker[0] += distance_travelled
 
-        if distance_travelled < 2:
-            driving_time = (distance_travelled/20) * 60    # average speed of 20km/hr, convert to minutes
-        else:
-            driving_time = np.random.uniform(5, 7)       # average speed of 20km/hr, +/-1 min variability
+        # short legs at an average speed of 20km/hr; long legs take 5-7 minutes (see network.py)
+        spread = network.spreads[route][leg]
+        driving_time = network.times[route][leg]
+        if spread:
+            driving_time += spread * self.driving_times.draw()
 
         done_boarding = self.board(stop, time)
         if done_boarding < earliest_depart:
             done_boarding = self.board(stop, time)
 
-        # first 25 passengers will sit down (or all, if less than 25 people on bus)
-        for i in range(min(self.occupancy, 25)):
-            self.passengers[i].state = 'sitting'
-
         return Event(done_boarding + driving_time, self, self.next_stop, 'arrival')
 
-    def add_animation(self, surface, depot):
+    def add_animation(self, renderer, depot):
         self.animate = True
-        self.surface = surface
-        self.icon = pygame.image.load('images/bus.png')
+        self.renderer = renderer
+        self.icon = renderer.image('images/bus.png')
         self.icon_rect = self.icon.get_rect()
         self.icon_rect.center = (depot.surface_pos[0] - 55, depot.surface_pos[1])
-        self.surface.blit(self.icon, self.icon_rect)
+        renderer.blit(self.icon, self.icon_rect)
 
     def update_animation(self):
-        self.icon_rect.center = (self.next_stop.surface_pos[0] - 55, self.next_stop.surface_pos[1])
-        self.surface.blit(self.icon, self.icon_rect)
-        pygame.display.flip()
+        self.renderer.draw_bus(self)
 
     def reset(self):
         """ reset simulation """
+        self.route = self.start_route
+        self.to_change = None
+        self.change_tracker = [0, 0]
         self.next_stop_num = 1
         self.next_stop = self.route.stops[1]
-        self.passengers = []
+        self.manifest = defaultdict(list)
         self.occupancy = 0
         self.distance = 0
         self.avg_occupancy = 0
         self.avg_standing = 0
-        self.avg_occupancy_t = {}
+        self.avg_occupancy_t = []
         self.dead_people = 0
+        self.population = None
 
 
 class BusStop:
@@ -432,83 +507,103 @@ class BusStop:
     Attributes:
         name (str): Name of the bus stop.
         num_waiting (int): Number of people currently waiting at this bus stop.
-        people_waiting (list): List of person objects representing people waiting at this bus stop
+        queues (dict): Dict of FIFO queues of ids of people waiting at this bus stop (key: destination, value: deque)
 
-        times (dict): Dict of arrival times of people arriving at this bus stop
+        destinations (list): List of destination BusStop objects, indexed by destination code
+        arrival_times (np.ndarray): Time-sorted arrival times of people arriving at this bus stop
+        arrival_dests (np.ndarray): Destination code of each arrival in arrival_times
+        cursor (int): Index of the next arrival in arrival_times that has not yet reached the stop
+        population (Population): Store of the riders in the current simulation run.
+        first_id (int): Rider id of the first arrival in arrival_times; ids follow the order of arrival
 
     """
     def __init__(self, name):
 
         self.name = name            # name of bus stop
+        self.id = None              # integer id, assigned by the Map this stop belongs to
         self.num_waiting = 0        # bus stop starts with nobody waiting
-        self.num_waiting_hr = 0     # hourly waiting number at bus stop
-        self.people_waiting = []    # list of people waiting at this stop; initially empty
+        self.queues = defaultdict(deque)  # destination -> FIFO queue of people waiting; initially empty
         self.arrival_rates = {}     # dict of arrival rates (key:destination, value: arrival rate)
-        self.times = {}             # dict of arrival times (key:destination, value:list of times)
+        self.destinations = []      # destination BusStop objects, indexed by destination code
+        self.arrival_times = np.empty(0)                # merged, time-sorted stream of arrival times
+        self.arrival_dests = np.empty(0, dtype=np.intp)  # destination code of each arrival
+        self.cursor = 0             # index of the next arrival that has not reached the stop yet
+        self.population = None      # rider store, set when the Map builds it from the arrival streams
+        self.first_id = 0           # rider id of the first arrival in the stream
+        self.boarding_times = VariateBuffer(np.random.default_rng(), 'triangular', (0, 1/60, 5/60))  # set by Map.simulate
 
         self.prev_num_waiting = 0   # used in animation to remove old images
         self.animate = False        # whether or not to generate animation
-        self.surface = None         # pygame.Surface object on which to render animation
+        self.renderer = None        # Renderer of the animation
         self.surface_pos = ()       # location on screen; (0,0) is the top left corner
 
         self.avg_num_waiting = 0    # statistics for number of people waiting
         self.waiting_time = {}      # destination(str) -> waiting time
         self.num_getoff = {}        # destination(str) -> number of people used this path
 
-        self.avg_num_waiting_t = {} # destination(str) -> list of number per hour
+        self.avg_num_waiting_t = [] # average number of people waiting per half-hour
+        self.waiting_stat = TimeWeighted(0)  # time-weighted statistics, set by Map.simulate
 
     def add_data(self, arrival_rates):
         """Record arrival rates to this bus stop as a dict (key: destination, value: arrival rate(s))"""
         self.arrival_rates = arrival_rates
 
-    def generate_data(self, max_time):
-        # TODO: generate with non-constant arrival rate
-        for stop in self.arrival_rates.keys():
+    def generate_data(self, max_time, streams=None):
+        """Generate arrivals for every destination and merge them into a single time-sorted stream
+        Args:
+            max_time (float): number of minutes for which to generate arrivals
+            streams (RandomStreams): source of the arrival streams (one per origin-destination pair).
+                Default is a fresh set of streams
+        """
+        streams = RandomStreams() if streams is None else streams
+        self.destinations = list(self.arrival_rates.keys())
+        times, dests = [], []
+        for code, stop in enumerate(self.destinations):
             lmbda = self.arrival_rates[stop]
-            np.random.seed()
+            rng = streams.stream('arrival', self.name + '-' + stop.name)
             if isinstance(lmbda, (list, np.ndarray)):
-                self.times[stop] = list(generate_arrival(lmbda, interval=180))
+                stream = generate_arrival(lmbda, interval=180, rng=rng)
             elif isinstance(lmbda, (int, float)):
-                self.times[stop] = list(np.cumsum(np.random.exponential(1/lmbda, int(max_time*lmbda))))
+                stream = generate_arrival([lmbda * 60], interval=max_time, rng=rng)  # constant rate (# arrival / minute)
             else:
                 raise ValueError('Arrival rates must be specified as a number or list/array.')
+            times.append(stream)
+            dests.append(np.full(len(stream), code, dtype=np.intp))
+
+        if times:
+            times = np.concatenate(times)
+            order = np.argsort(times, kind='stable')    # ties keep destination order
+            self.arrival_times = times[order]
+            self.arrival_dests = np.concatenate(dests)[order]
+        else:
+            self.arrival_times = np.empty(0)
+            self.arrival_dests = np.empty(0, dtype=np.intp)
+        self.cursor = 0
 
-    def add_animation(self, surface, coords):
+    def add_animation(self, renderer, coords):
         """Set animation attributes
         Args:
-            surface (pygame.Surface): pygame Surface object on which to render the animation
+            renderer (Renderer): Renderer drawing the animation
             coords (tuple): a tuple of ints/floats specifying the (x,y) location of the bus stop
         """
         self.animate = True
-        self.surface = surface
+        self.renderer = renderer
         self.surface_pos = coords
 
+    @property
+    def people_waiting(self):
+        """List of all people waiting at this bus stop, in order of arrival"""
+        return [Person(self.population, rider) for rider in heapq.merge(*self.queues.values())]
+
     def update_animation(self):
         """Updates the animation screen to reflect current people waiting at this bus stop"""
-        # remove unused images
-        clear = pygame.image.load('images/nobody.png')
-        for i in range(self.prev_num_waiting):
-            clear_rect = clear.get_rect()
-            clear_rect.center = (self.surface_pos[0] + 35 + 5*i, self.surface_pos[1])
-            self.surface.blit(clear, clear_rect)
-
-        # colour-code images of people by destination
-        person_img = {'Wegmans-Eastbound': pygame.image.load('images/person_green.png'),
-                      'Wegmans-Westbound': pygame.image.load('images/person_green.png'),
-                      'Commons-Eastbound': pygame.image.load('images/person_blue.png'),
-                      'Commons-Westbound': pygame.image.load('images/person_blue.png'),
-                      'Collegetown': pygame.image.load('images/person_orange.png')}
-        for i, person in enumerate(self.people_waiting):
-            person_rect = person_img[person.destination.name].get_rect()
-            person_rect.center = (self.surface_pos[0] + 35 + 5*i, self.surface_pos[1])
-            self.surface.blit(person_img[person.destination.name], person_rect)
-        self.prev_num_waiting = self.num_waiting
-
-    def arrival(self, person):
-        """Models the arrival of a person to a bus stop"""
+        self.renderer.draw_stop(self)
+
+    def arrival(self, rider, destination, time):
+        """Models the arrival of a person (by rider id) to a bus stop at a given time"""
         self.num_waiting += 1
-        self.num_waiting_hr += 1
-        self.people_waiting.append(person)
+        self.waiting_stat.update(time, self.num_waiting)
+        self.queues[destination].append(rider)
 
     def add_waiting_time(self, dest, time):
         """Add waiting time in the dictionary """
@@ -521,57 +616,79 @@ class BusStop:
 
     def update(self, time):
         """Updates arrivals to this bus stop until a given time"""
-        arrived = 0
-        for destination, arrival_times in self.times.items():
-            for arrival_time in arrival_times[:]:
-                if arrival_time < time:
-                    arrived += 1
-                    self.arrival(Person(self, destination, arrival_time))
-                    arrival_times.remove(arrival_time)
-                else:
-                    break
+        # people arriving strictly before the given time are those between the cursor and the insertion point
+        end = int(np.searchsorted(self.arrival_times, time, side='left'))
+        arrived = max(end - self.cursor, 0)
+        if arrived:
+            riders = range(self.first_id + self.cursor, self.first_id + end)
+            codes = self.arrival_dests[self.cursor:end].tolist()
+            times = self.arrival_times[self.cursor:end].tolist()
+            for rider, code, arrival_time in zip(riders, codes, times):
+                self.arrival(rider, self.destinations[code], arrival_time)
+            self.cursor = end
 
         if self.animate:
-            self.update_animation()
+            self.update_animation()    # drawn on the display by the Map once per event
             # sleep(0.1)               # controls speed of animation
-            pygame.display.flip()      # update display
 
         return arrived
 
     def reset(self):
         """Reset map to initial (or newly generated) settings"""
         self.num_waiting = 0
-        self.people_waiting = []
-        self.num_waiting_hr = 0
+        self.queues = defaultdict(deque)
+        self.arrival_times = np.empty(0)        # release the arrival streams of the last run
+        self.arrival_dests = np.empty(0, dtype=np.intp)
+        self.population = None
+        self.cursor = 0
         self.avg_num_waiting = 0
         self.waiting_time = {}
         self.num_getoff = {}
-        self.avg_num_waiting_t = {}
+        self.avg_num_waiting_t = []
 
 
 class Person:
-    """ Models a person trying to get around Ithaca.
+    """ Read-only view of a person trying to get around Ithaca.
+
+    Riders are stored in a compact Population store; a Person only wraps a rider id and is created on demand
+    for debugging and animation.
 
     Attributes:
         origin (BusStop): Where this person starts.
         destination (BusStop): Where this person is trying to get to.
 
-        state (str): Describes state of person. One of 'waiting', 'sitting', 'standing', 'arrived'.
+        state (str): Describes state of person. One of 'waiting', 'riding', 'arrived'. Whether riders sit or
+            stand is not tracked per person; see Bus.num_sitting and Bus.num_standing.
         start_time (float): Time at which person arrived at origin bus stop.
-        waiting_time (float): Time spent waiting at origin bus stop.
+        waiting_time (float): Time spent waiting at origin bus stop (None until boarded).
 
     """
-    def __init__(self, origin, destination, time):
+    __slots__ = ('population', 'rider')
+
+    def __init__(self, population, rider):
+        self.population = population       # Population store holding this person
+        self.rider = rider                 # rider id in the store
+
+    @property
+    def origin(self):
+        return self.population.stops[self.population.origin[self.rider]]
+
+    @property
+    def destination(self):
+        return self.population.stops[self.population.destination[self.rider]]
 
-        assert(isinstance(origin, BusStop)), "origin must be a BusStop"
-        assert(isinstance(destination, BusStop)), "destination must be a BusStop"
+    @property
+    def state(self):
+        return STATES[self.population.state[self.rider]]
 
-        self.origin = origin               # origin bus stop
-        self.destination = destination     # destination bus stop
+    @property
+    def start_time(self):
+        return self.population.start_time.item(self.rider)
 
-        self.state = 'waiting'             # status of person, either 'waiting', 'standing' or 'sitting'
-        self.start_time = time             # time at which person started waiting
-        self.waiting_time = None           # time spent waiting at bus stop
+    @property
+    def waiting_time(self):
+        board_time = self.population.board_time.item(self.rider)
+        return None if np.isnan(board_time) else board_time - self.start_time
 
 
 class Route:
@@ -583,6 +700,10 @@ class Route:
         distances (list): A list of floats representing the distances between each of the stops on the route.
             Length should be one less than the length of stopList.
         num (int): Route number as defined in writeup.
+        index (int): Index of this route in the Network tables compiled by the Map.
+        stop_mask (np.ndarray): Boolean array, indexed by stop id, of the stops on this route. Set by the Network;
+            e.g. stop_mask[population.destination] filters many riders at once.
+        serves (list): stop_mask as a list of bools, for fast lookups of a single stop.
 
     """
     def __init__(self, stop_list, distance_list, switch_points, number):
@@ -594,3 +715,6 @@ class Route:
         self.distances = distance_list      # list of number, which represents the distance between stations
         self.switch_points = switch_points  # dict of lists specifying switch point information
         self.num = number                   # Route number: one of [1,2,3]
+        self.index = None                   # row of this route in the Network tables, set by the Network
+        self.stop_mask = None               # stop id -> whether this route stops there, set by the Network
+        self.serves = None
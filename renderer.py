@@ -0,0 +1,85 @@
+import datetime
+import pygame
+
+# image of the people waiting for each destination
+PERSON_IMAGES = {'Wegmans-Eastbound': 'images/person_green.png',
+                 'Wegmans-Westbound': 'images/person_green.png',
+                 'Commons-Eastbound': 'images/person_blue.png',
+                 'Commons-Westbound': 'images/person_blue.png',
+                 'Collegetown': 'images/person_orange.png'}
+
+
+class Renderer:
+    """ Draws the animation of a simulation on a pygame surface.
+
+    Images and fonts are loaded once and reused for every frame. Drawing only marks the rectangles that changed
+    (the queue of a bus stop, the clock, a bus icon) as dirty, and present() pushes just those rectangles to the
+    display instead of repainting the whole window.
+
+    Args:
+        surface (pygame.Surface) : surface on which to render the animation
+        size (tuple) : (width, height) of the window
+    """
+    def __init__(self, surface, size=(1080, 720)):
+        self.surface = surface
+        self.width, self.height = size
+        self.images = {}    # file name -> loaded image
+        self.fonts = {}     # (name, size) -> font
+        self.dirty = []     # rectangles changed since the last present()
+        self.start = datetime.datetime(2017, 12, 1, 6, 0)   # wall-clock time at the start of the simulation
+
+    def image(self, path):
+        """Image loaded from a file, loaded on first use"""
+        if path not in self.images:
+            self.images[path] = pygame.image.load(path)
+        return self.images[path]
+
+    def font(self, name, size):
+        """System font, created on first use"""
+        if (name, size) not in self.fonts:
+            self.fonts[(name, size)] = pygame.font.SysFont(name, size)
+        return self.fonts[(name, size)]
+
+    def blit(self, image, rect):
+        """Draw an image and mark its rectangle as dirty"""
+        self.dirty.append(self.surface.blit(image, rect))
+
+    def draw_stop(self, stop):
+        """Draw the people waiting at a bus stop, colour-coded by destination"""
+        x, y = stop.surface_pos
+        rects = []
+        # remove the previous images
+        clear = self.image('images/nobody.png')
+        for i in range(stop.prev_num_waiting):
+            rects.append(self.surface.blit(clear, clear.get_rect(center=(x + 35 + 5*i, y))))
+
+        for i, person in enumerate(stop.people_waiting):
+            image = self.image(PERSON_IMAGES[person.destination.name])
+            rects.append(self.surface.blit(image, image.get_rect(center=(x + 35 + 5*i, y))))
+        stop.prev_num_waiting = stop.num_waiting
+        if rects:
+            self.dirty.append(rects[0].unionall(rects[1:]))     # one rectangle for the whole queue
+
+    def draw_clock(self, elapsed):
+        """Draw the clock in the bottom right corner"""
+        clear = self.image('images/blank.png')
+        self.blit(clear, clear.get_rect(bottomright=(self.width, self.height)))
+
+        current = (self.start + datetime.timedelta(minutes=elapsed)).time()
+        clock = self.font("Helvetica", 15).render('Time: ' + str(current)[:5], 1, (255, 255, 255))
+        self.blit(clock, (self.width - 90, self.height - 30))
+
+    def draw_bus(self, bus):
+        """Draw a bus next to the stop it is heading to"""
+        if bus.icon is None:
+            bus.icon = self.image('images/bus.png')
+            bus.icon_rect = bus.icon.get_rect()
+        self.dirty.append(bus.icon_rect.copy())    # previous position
+        bus.icon_rect.center = (bus.next_stop.surface_pos[0] - 55, bus.next_stop.surface_pos[1])
+        self.blit(bus.icon, bus.icon_rect)
+
+    def present(self):
+        """Push the dirty rectangles to the display"""
+        if self.dirty:
+            pygame.display.update(self.dirty)
+            self.dirty = []
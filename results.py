@@ -0,0 +1,88 @@
+import os
+import numpy as np
+
+
+def to_columns(stats):
+    """Convert a list of stats dicts (one per simulation) into a dict of typed columns
+
+    Scalar stats become 1-d arrays with one entry per simulation. Time-series stats (arrays) become 2-d float
+    arrays with one row per simulation. Stats missing from a simulation (e.g. a path never travelled) are NaN.
+    Args:
+        stats (list) : list of dicts returned by Map.collect_stats (plus e.g. 'model' and 'iteration')
+    """
+    names = list(dict.fromkeys(name for row in stats for name in row))
+    columns = {}
+    for name in names:
+        values = [row.get(name) for row in stats]
+        present = [value for value in values if value is not None]
+        if any(isinstance(value, (list, np.ndarray)) for value in present):
+            length = max(len(value) for value in present)
+            column = np.full((len(values), length), np.nan)
+            for i, value in enumerate(values):
+                if value is not None:
+                    column[i, :len(value)] = value
+        elif any(isinstance(value, str) for value in present):
+            column = np.array(['' if value is None else value for value in values], dtype=str)
+        else:
+            column = np.array([np.nan if value is None else value for value in values])
+        columns[name] = column
+    return columns
+
+
+def save_results(stats, path):
+    """Save simulation results in a columnar binary (.npz) file
+    Args:
+        stats (list or dict) : list of stats dicts, or a dict of columns as returned by to_columns
+        path (str) : file name of the output
+    """
+    columns = to_columns(stats) if isinstance(stats, list) else stats
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    save_columns(columns, path)
+
+
+def save_columns(columns, path, compressed=True):
+    """Save a dict of named arrays as an .npz file (also used for the binary copies of the arrival rates)
+    Args:
+        columns (dict) : column name -> array
+        path (str) : file name of the output
+        compressed (bool) : if true, compress the arrays
+    """
+    save = np.savez_compressed if compressed else np.savez
+    # columns are stored by position since names (e.g. stat names, '#/hr') are not valid archive member names
+    save(path, columns=np.array(list(columns), dtype=str),
+         **{'col{}'.format(i): values for i, values in enumerate(columns.values())})
+
+
+def load_columns(path):
+    """Load a dict of columns saved by save_columns (or save_results)"""
+    with np.load(path) as data:
+        return {str(name): data['col{}'.format(i)] for i, name in enumerate(data['columns'])}
+
+
+def load_results(path):
+    """Load simulation results saved by save_results as a DataFrame
+
+    Time-series stats are returned as columns holding one float array per simulation.
+    """
+    return to_frame(load_columns(path))
+
+
+def to_frame(columns):
+    """Build a DataFrame (one row per simulation) from a dict of columns"""
+    import pandas as pd     # only needed for DataFrames; keeps pandas off the engine's import path (see arrival.py)
+    return pd.DataFrame({name: list(values) if values.ndim == 2 else values for name, values in columns.items()})
+
+
+def from_frame(df):
+    """Convert a DataFrame of results (as returned by to_frame) back into a dict of columns"""
+    columns = {}
+    for name in df.columns:
+        values = df[name].to_numpy()
+        if len(values) and isinstance(values[0], np.ndarray):
+            values = np.stack(values)
+        elif len(values) and isinstance(values[0], str):
+            values = values.astype(str)
+        columns[name] = values
+    return columns
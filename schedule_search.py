@@ -0,0 +1,110 @@
+import numpy as np
+from evaluation import EvaluationCache, avg_waiting_time, canonical_schedule, evaluate_batch
+from optimization import save_obj
+
+ROUTES = (1, 2, 3)  # routes a bus can drive in a 3-hour block
+
+
+def neighbors(schedule, rng, size, fixed=1, routes=ROUTES):
+    """ Random distinct neighbors of a schedule, each changing the route of one bus in one 3-hour block
+    Args:
+        schedule (tuple) : canonical schedule (see evaluation.canonical_schedule)
+        rng (np.random.Generator) : random number generator of the search
+        size (int) : number of neighbors to draw (fewer are returned if the neighborhood is smaller)
+        fixed (int) : number of leading buses whose schedule is never changed
+        routes (tuple) : routes a bus can drive
+    Returns:
+        list of canonical schedules
+    """
+    moves = [(bus, block, route) for bus in range(fixed, len(schedule)) for block in range(len(schedule[bus]))
+             for route in routes if route != schedule[bus][block]]
+    result, seen = [], {schedule}
+    for move in rng.permutation(len(moves)):
+        bus, block, route = moves[move]
+        rows = [list(routes_per_hr) for routes_per_hr in schedule]
+        rows[bus][block] = route
+        # canonicalize, keeping the fixed buses in place
+        neighbor = tuple(map(tuple, rows[:fixed])) + canonical_schedule(rows[fixed:])
+        if neighbor not in seen:        # different moves can lead to the same canonical schedule
+            seen.add(neighbor)
+            result.append(neighbor)
+            if len(result) == size:
+                break
+    return result
+
+
+def anneal(objective=avg_waiting_time, initial=None, iterations=200, batch=8, initial_temperature=0.05,
+           final_temperature=0.001, fixed=1, max_time=60*18, replications=10, seed=None, search_seed=None,
+           arrival_data='data/ArrivalRates.xlsx', cache=None, workers=None, printing=True):
+    """ Minimize an objective over bus schedules by simulated annealing
+
+    Every step evaluates a batch of random neighbors of the current schedule in parallel (see
+    evaluation.evaluate_batch) and moves to the best of them with the Metropolis rule: improvements are always
+    accepted, and a relative worsening d with probability exp(-d / temperature). The temperature decreases
+    geometrically from initial_temperature to final_temperature. All schedules are simulated with the same root
+    seed (common random numbers), so differences between them reflect the schedules rather than sampling noise.
+    Args:
+        objective (function) : maps the stats (DataFrame) of a schedule to the value to minimize
+        initial (list) : starting schedule, one row of routes per bus. Default runs every bus on route 1
+        iterations (int) : number of steps (batches of neighbors)
+        batch (int) : number of neighbors evaluated per step
+        initial_temperature (float) : initial temperature, as a relative worsening of the objective
+        final_temperature (float) : temperature at the last step
+        fixed (int) : number of leading buses whose schedule is never changed (bus 1 by default)
+        max_time (int) : duration time for each simulation
+        replications (int) : number of replications per schedule
+        seed (int) : root seed of the simulations. None draws fresh entropy once for the whole search
+        search_seed (int) : seed of the random moves and acceptance decisions
+        arrival_data (str) : spreadsheet of arrival rates
+        cache (EvaluationCache) : cache of evaluations. None always simulates
+        workers (int) : number of worker processes. Default is the number of CPUs
+        printing (bool) : if true, print the progress of the search
+    Returns:
+        (best schedule, best objective value, list of dicts with the temperature and values of every step)
+    """
+    seed = np.random.SeedSequence(seed).entropy  # one root seed for the whole search: common random numbers
+    rng = np.random.default_rng(search_seed)
+
+    def evaluate_all(candidates):
+        values = [None] * len(candidates)
+        for i, value in evaluate_batch(candidates, objective, max_time, replications, seed=seed,
+                                       arrival_data=arrival_data, cache=cache, workers=workers):
+            values[i] = value
+        return values
+
+    if initial is None:
+        initial = [[1] * 6 for _ in range(7)]
+    current = tuple(tuple(int(route) for route in row) for row in initial[:fixed]) + canonical_schedule(initial[fixed:])
+    current_value = evaluate_all([current])[0]
+    best, best_value = current, current_value
+    cooling = (final_temperature / initial_temperature) ** (1 / max(1, iterations - 1))
+    temperature = initial_temperature
+    history = []
+
+    for step in range(iterations):
+        candidates = neighbors(current, rng, batch, fixed)
+        if not candidates:
+            break
+        values = evaluate_all(candidates)
+        i = int(np.argmin(values))
+        change = (values[i] - current_value) / abs(current_value) if current_value else values[i] - current_value
+        if change <= 0 or rng.random() < np.exp(-change / temperature):
+            current, current_value = candidates[i], values[i]
+        if current_value < best_value:
+            best, best_value = current, current_value
+        history.append({'step': step, 'temperature': temperature, 'current': current_value, 'best': best_value})
+        if printing:
+            print('step {}: temperature {:.4f}, current {:.4f}, best {:.4f}'.format(
+                step, temperature, current_value, best_value))
+        temperature *= cooling
+
+    return [list(row) for row in best], best_value, history
+
+
+if __name__ == "__main__":
+    schedule, value, history = anneal(avg_waiting_time, iterations=200, batch=8, seed=2017,
+                                      cache=EvaluationCache('results/cache'))
+    print('Lowest function value found: %f' % value)
+    print('Schedule %s' % schedule)
+
+    save_obj(schedule, 'lowest_waiting_time_schedule')
@@ -0,0 +1,141 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from results import to_columns, to_frame
+
+
+def seed_key(seed):
+    """String identifying a SeedSequence, e.g. '1234/0.5' for entropy 1234 and spawn key (0, 5)"""
+    return '{}/{}'.format(seed.entropy, '.'.join(str(k) for k in seed.spawn_key))
+
+
+class ResultSink:
+    """ Append-only store of experiment results that is written as each replication completes.
+
+    Each completed (model index, replication, seed) unit is appended as one JSON line to the results file, so
+    memory stays flat however many replications are run and a crash loses at most the replications in
+    flight. A manifest next to the results file records the settings and the models of the experiment; an
+    interrupted experiment is resumed by running it again with the same sink and models (in the same order),
+    which skips the units already recorded.
+
+    Args:
+        path (str) : file name of the results (JSON lines); the manifest is written to <path>.manifest.json
+    """
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = path + '.manifest.json'
+
+    def open(self, max_time, seed=None, common_random_numbers=False, models=None):
+        """Start a new experiment, or resume the one recorded in the manifest
+
+        Returns the root SeedSequence of the experiment. When resuming, a seed of None reuses the recorded seed.
+        Raises ValueError if the settings or the models differ from those of the recorded experiment.
+        Args:
+            models (list) : JSON-compatible identity of each model, in experiment order (units are keyed by
+                model index, so resuming with other models, or the same models in another order, is refused)
+        """
+        # compared as loaded back from JSON, e.g. with tuples as lists
+        settings = json.loads(json.dumps({'max_time': max_time, 'common_random_numbers': common_random_numbers,
+                                          'models': models}))
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if seed is None:
+                seed = manifest['entropy']
+            root = np.random.SeedSequence(seed)
+            recorded = {key: manifest.get(key) for key in settings}
+            if recorded != settings or root.entropy != manifest['entropy']:
+                raise ValueError('{} holds an experiment with different settings: {}'.format(
+                    self.path, dict(recorded, entropy=manifest['entropy'])))
+            self._truncate_partial_line()
+        else:
+            root = np.random.SeedSequence(seed)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.manifest_path + '.tmp', 'w') as f:
+                json.dump(dict(settings, entropy=root.entropy), f)
+            os.replace(self.manifest_path + '.tmp', self.manifest_path)
+            open(self.path, 'w').close()
+        return root
+
+    def _truncate_partial_line(self):
+        """Drop a line left incomplete by an interrupted write"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:                      # scan backwards for the last newline
+                step = min(4096, pos)
+                pos -= step
+                f.seek(pos)
+                chunk = f.read(step)
+                if pos + step == end and chunk.endswith(b'\n'):
+                    return
+                newline = chunk.rfind(b'\n')
+                if newline >= 0:
+                    f.truncate(pos + newline + 1)
+                    return
+            f.truncate(0)
+
+    def append(self, index, model, replication, seed, stats):
+        """Record the stats of one completed replication
+        Args:
+            index (int) : index of the model in the experiment; identifies the model, since names may repeat
+            model (str) : name of the model
+            replication (int) : index of the replication
+            seed (SeedSequence) : seed of the replication
+            stats (dict) : stats returned by Map.collect_stats
+        """
+        stats = {name: value.tolist() if isinstance(value, (np.ndarray, np.generic)) else value
+                 for name, value in stats.items()}
+        line = json.dumps({'index': index, 'model': model, 'replication': replication, 'seed': seed_key(seed),
+                           'stats': stats})
+        with open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+    def records(self):
+        """Iterate over the recorded units, one dict at a time"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                if line.endswith('\n'):         # skip a line left incomplete by an interrupted write
+                    yield json.loads(line)
+
+    def completed(self):
+        """Set of (model index, replication, seed key) units already recorded"""
+        return {(record['index'], record['replication'], record['seed']) for record in self.records()}
+
+    def read_indexed(self):
+        """Iterate over (model index, stats dict) pairs of the recorded units; time-series stats are float arrays"""
+        for record in self.records():
+            yield record['index'], {name: np.array(value, dtype=float) if isinstance(value, list) else value
+                                    for name, value in record['stats'].items()}
+
+    def read(self):
+        """Iterate over the recorded stats dicts; time-series stats are float arrays"""
+        for index, stats in self.read_indexed():
+            yield stats
+
+    def load(self):
+        """Load all recorded stats as a DataFrame (one row per replication)"""
+        return to_frame(to_columns(list(self.read())))
+
+    def summary(self):
+        """Mean of every scalar stat per model (one row per model index, labelled by name), computed in a single
+        streaming pass"""
+        names, sums, counts = {}, {}, {}
+        for index, stats in self.read_indexed():
+            names[index] = stats['model']
+            model_sums = sums.setdefault(index, {})
+            model_counts = counts.setdefault(index, {})
+            for name, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    model_sums[name] = model_sums.get(name, 0) + value
+                    model_counts[name] = model_counts.get(name, 0) + 1
+        indices = sorted(sums)
+        return pd.DataFrame([{name: total / counts[index][name] for name, total in sums[index].items()}
+                             for index in indices], index=[names[index] for index in indices])
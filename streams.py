@@ -0,0 +1,78 @@
+import zlib
+import numpy as np
+
+
+class RandomStreams:
+    """ Independent random number streams for each source of randomness in one simulation run.
+
+    Every stream is derived from a single SeedSequence by its purpose (e.g. 'arrival', 'boarding',
+    'driving') and the name of the entity drawing from it. Streams therefore do not depend on how many
+    other entities exist or in which order they draw, so two models simulated with the same seed see the
+    same arrivals at each stop, the same boarding times at each stop and the same driving times for each bus
+    (common random numbers).
+
+    Args:
+        seed (int, SeedSequence or None) : root seed of the run. None draws fresh entropy from the OS
+    """
+    def __init__(self, seed=None):
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self._streams = {}  # (purpose, name) -> np.random.Generator
+
+    def stream(self, purpose, name):
+        """Return the random number generator for a purpose and entity name"""
+        key = (purpose, name)
+        if key not in self._streams:
+            root = self.seed_sequence
+            spawn_key = root.spawn_key + (zlib.crc32(purpose.encode()), zlib.crc32(name.encode()))
+            self._streams[key] = np.random.default_rng(np.random.SeedSequence(root.entropy, spawn_key=spawn_key))
+        return self._streams[key]
+
+    def buffer(self, purpose, name, distribution, params, block_size=4096):
+        """Return a VariateBuffer drawing from the stream of a purpose and entity name
+        Args:
+            purpose (str) : purpose of the stream, e.g. 'boarding'
+            name (str) : name of the entity drawing from the stream
+            distribution (str) : name of a np.random.Generator method, e.g. 'triangular'
+            params (tuple) : positional parameters of the distribution
+            block_size (int) : number of variates generated per refill
+        """
+        return VariateBuffer(self.stream(purpose, name), distribution, params, block_size)
+
+
+class VariateBuffer:
+    """ Hands out random variates one at a time from large pre-generated blocks.
+
+    Drawing a scalar from NumPy costs microseconds of call overhead, which dominates when one value is needed
+    per event. A buffer generates block_size variates in a single call and serves them from a Python list,
+    refilling in bulk once the block is used up.
+
+    Args:
+        rng (np.random.Generator) : stream to draw from
+        distribution (str) : name of a np.random.Generator method, e.g. 'triangular'
+        params (tuple) : positional parameters of the distribution
+        block_size (int) : number of variates generated per refill
+    """
+    def __init__(self, rng, distribution, params, block_size=4096):
+        self.rng = rng
+        self.distribution = distribution
+        self.params = tuple(params)
+        self.block_size = block_size
+        self._block = []    # remaining variates, in reverse order of drawing
+
+    def draw(self):
+        """Return the next variate"""
+        if not self._block:
+            block = getattr(self.rng, self.distribution)(*self.params, size=self.block_size)
+            self._block = block[::-1].tolist()
+        return self._block.pop()
+
+
+def replication_seed(root, replication, model_index=None):
+    """SeedSequence of one replication in an experiment
+    Args:
+        root (SeedSequence) : root seed of the experiment
+        replication (int) : index of the replication
+        model_index (int) : index of the model. None gives every model the same seed (common random numbers)
+    """
+    key = (replication,) if model_index is None else (model_index, replication)
+    return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + key)
@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)     # the modules live at the top level of the repository
+
+
+@pytest.fixture(autouse=True)
+def in_root(monkeypatch):
+    """Run every test from the repository root, where the data/ paths used by create_map resolve"""
+    monkeypatch.chdir(ROOT)
+
+
+def simulate(m, max_time=180, seed=1, **kwargs):
+    """Run one replication of a map and return its stats"""
+    m.simulate(max_time, seed=seed, **kwargs)
+    stats = m.collect_stats()
+    m.reset()
+    return stats
+
+
+def assert_same_stats(a, b):
+    """Assert that two stats dicts (as returned by Map.collect_stats) are identical"""
+    import numpy as np
+    assert a.keys() == b.keys()
+    for name in a:
+        np.testing.assert_array_equal(a[name], b[name], err_msg=name)
@@ -0,0 +1,49 @@
+import pandas as pd
+from evaluation import EvaluationCache, avg_waiting_time, canonical_schedule, evaluate, evaluate_batch, relabel_buses
+
+SCHEDULE = [[1] * 6, [2, 2, 1, 1, 3, 1], [3] * 6, [1, 2, 2, 1, 1, 1], [2] * 6, [1, 1, 2, 3, 2, 1],
+            [1, 2, 2, 1, 1, 1]]
+RUN = dict(max_time=120, replications=2, seed=1, workers=1)
+
+
+def test_canonical_schedule_ignores_bus_order():
+    canonical = canonical_schedule(SCHEDULE)
+    assert canonical == canonical_schedule(SCHEDULE[::-1])
+    assert list(canonical) == sorted(canonical)
+    assert canonical[-1] == (3,) * 6
+
+
+def test_relabel_buses_follows_callers_bus_order():
+    # canonical bus k has the k-th smallest row; bus 3 (all 3s) is canonical bus 7, bus 5 (all 2s) is bus 6
+    stats = pd.DataFrame({'Bus{} distance'.format(k): [k] for k in range(1, 8)})
+    stats['total dead people'] = 0
+    relabelled = relabel_buses(stats, SCHEDULE)
+    assert list(relabelled.columns) == list(stats.columns)
+    assert relabelled['Bus3 distance'][0] == 7
+    assert relabelled['Bus5 distance'][0] == 6
+    assert relabelled['Bus1 distance'][0] == 1
+    assert relabelled['total dead people'][0] == 0
+    assert relabel_buses(stats, canonical_schedule(SCHEDULE)) is stats
+
+
+def test_relabel_buses_keeps_bus1_and_bus10_apart():
+    schedule = [[2] * 6] + [[1] * 6] * 10         # canonical order moves bus 1 to the end
+    stats = pd.DataFrame({'Bus{} distance'.format(k): [k] for k in range(1, 12)})
+    relabelled = relabel_buses(stats, schedule)
+    assert relabelled['Bus1 distance'][0] == 11
+    assert relabelled['Bus10 distance'][0] == 9
+
+
+def test_evaluate_reports_buses_in_callers_order(tmp_path):
+    cache = EvaluationCache(str(tmp_path))
+    permuted = evaluate(SCHEDULE, cache=cache, **RUN)
+    canonical = evaluate(canonical_schedule(SCHEDULE), cache=cache, **RUN)
+    assert cache.hits == 1                  # both orders share one cache entry
+    assert permuted['Bus3 distance'].tolist() == canonical['Bus7 distance'].tolist()
+    assert permuted['Bus5 distance'].tolist() == canonical['Bus6 distance'].tolist()
+    assert avg_waiting_time(permuted) == avg_waiting_time(canonical)
+
+    batch = dict(evaluate_batch([SCHEDULE, canonical_schedule(SCHEDULE)],
+                                lambda stats: stats['Bus3 distance'].mean(), cache=cache, **RUN))
+    assert batch[0] == permuted['Bus3 distance'].mean()
+    assert batch[1] == canonical['Bus3 distance'].mean()
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from conftest import assert_same_stats, simulate
+from event_list import CalendarQueue, HeapQueue, make_event_list
+from experiment import create_map
+
+SCHEDULE = [[1, 2, 3, 1, 2, 3], [2] * 6, [3, 1, 2, 3, 1, 2], [1] * 6, [2, 3, 1, 2, 3, 1], [3] * 6, [1] * 6]
+
+
+def test_calendar_queue_pops_in_heap_order():
+    rng = np.random.default_rng(0)
+    heap, calendar = HeapQueue(), CalendarQueue()
+    now, popped = 0.0, 0
+    for step in range(5000):
+        if len(heap) and rng.uniform() < 0.45:      # interleave pops with pushes at and after the current time
+            event = heap.pop()
+            assert calendar.pop() == event
+            now = event[0]
+            popped += 1
+        else:
+            time = now + rng.choice([0, rng.exponential(5), rng.exponential(500)])
+            heap.push(time, (time, step))
+            calendar.push(time, (time, step))
+        assert len(calendar) == len(heap)
+    while len(heap):
+        assert calendar.pop() == heap.pop()
+    assert popped > 1000
+
+
+def test_calendar_queue_breaks_ties_in_insertion_order():
+    calendar = CalendarQueue()
+    for i in range(100):
+        calendar.push(7.0, i)
+    assert [calendar.pop() for _ in range(100)] == list(range(100))
+    with pytest.raises(IndexError):
+        calendar.pop()
+
+
+def test_make_event_list_rejects_unknown_kind():
+    with pytest.raises(ValueError):
+        make_event_list('splay')
+
+
+def test_calendar_and_heap_simulations_match():
+    heap = simulate(create_map(SCHEDULE, event_list='heap'))
+    calendar = simulate(create_map(SCHEDULE, event_list='calendar'))
+    assert_same_stats(heap, calendar)
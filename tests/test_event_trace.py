@@ -0,0 +1,47 @@
+import numpy as np
+import pySimio
+import pytest
+from conftest import assert_same_stats, simulate
+from event_trace import TraceReader, TraceRecorder
+from experiment import create_map
+from instrument import Instrumentation
+
+SCHEDULE = [[1, 2, 3, 1, 2, 3], [2] * 6, [3, 1, 2, 3, 1, 2], [1] * 6, [2, 3, 1, 2, 3, 1], [3] * 6, [1] * 6]
+
+
+def test_traced_run_has_the_same_stats(tmp_path):
+    path = str(tmp_path / 'run.trace')
+    m = create_map(SCHEDULE)
+    plain = simulate(m)
+    # a small buffer, so that records are written in several blocks; traced together with instrumentation
+    assert_same_stats(simulate(m, trace=TraceRecorder(path, buffer_size=64), instrument=Instrumentation()), plain)
+    assert 'arrive' not in m.buses[0].__dict__
+
+    trace = TraceReader(path)
+    assert len(trace) == m.num_events
+    assert trace.buses == [bus.name for bus in m.buses]
+    assert np.all(np.diff(trace.records['time']) >= 0)
+    window = trace.between(60, 120)
+    assert len(window) and window['time'].min() >= 60 and window['time'].max() < 120
+    assert set(trace.to_frame()['type']) == {'arrival', 'departure'}
+
+
+def test_trace_is_written_when_a_run_fails(tmp_path, monkeypatch):
+    arrive = pySimio.Bus.arrive
+    calls = [0]
+
+    def fail_later(self, *args, **kwargs):
+        calls[0] += 1
+        if calls[0] > 50:
+            raise RuntimeError('boom')
+        return arrive(self, *args, **kwargs)
+    monkeypatch.setattr(pySimio.Bus, 'arrive', fail_later)
+
+    path = str(tmp_path / 'failed.trace')
+    recorder = TraceRecorder(path, buffer_size=16)
+    m = create_map(SCHEDULE)
+    with pytest.raises(RuntimeError):
+        m.simulate(180, seed=1, trace=recorder)
+    assert recorder.file is None
+    assert 'arrive' not in m.buses[0].__dict__
+    assert len(TraceReader(path)) >= 50         # every arrival before the failure, and the departures between
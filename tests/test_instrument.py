@@ -0,0 +1,35 @@
+import pySimio
+import pytest
+from conftest import assert_same_stats, simulate
+from experiment import create_map
+from instrument import Instrumentation
+
+SCHEDULE = [[1, 2, 3, 1, 2, 3], [2] * 6, [3, 1, 2, 3, 1, 2], [1] * 6, [2, 3, 1, 2, 3, 1], [3] * 6, [1] * 6]
+
+
+def wrapped(m):
+    """Names of the instance attributes set on a map's objects by a wrapper"""
+    stop = next(iter(m.bus_stops.values()))
+    return [attr for obj, attrs in ((m.buses[0], ('board', 'arrive', 'depart')), (stop, ('update',)),
+                                    (m.event_queue, ('pop',))) for attr in attrs if attr in obj.__dict__]
+
+
+def test_instrumented_run_has_the_same_stats():
+    m = create_map(SCHEDULE)
+    plain = simulate(m)
+    instrument = Instrumentation(sample_every=5)
+    assert_same_stats(simulate(m, instrument=instrument), plain)
+    assert wrapped(m) == []
+    assert sum(instrument.event_counts.values()) == m.num_events + 1    # plus the event past max_time
+    assert instrument.calls['Bus.depart'] == instrument.event_counts['departure']
+    assert instrument.samples
+
+
+def test_wrappers_are_removed_when_a_run_fails(monkeypatch):
+    def fail(self, stop, time, debug=False):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(pySimio.Bus, 'arrive', fail)
+    m = create_map(SCHEDULE)
+    with pytest.raises(RuntimeError):
+        m.simulate(180, seed=1, instrument=Instrumentation())
+    assert wrapped(m) == []
@@ -0,0 +1,21 @@
+import pytest
+from experiment import EXACT_T_DF, t_cdf, t_quantile
+
+# two-sided 95% and 99% critical values of Student's t distribution (standard tables)
+T_TABLE = {1: (12.706, 63.657), 2: (4.303, 9.925), 3: (3.182, 5.841), 4: (2.776, 4.604), 5: (2.571, 4.032),
+           9: (2.262, 3.250), 10: (2.228, 3.169), 19: (2.093, 2.861), 29: (2.045, 2.756), 30: (2.042, 2.750),
+           60: (2.000, 2.660), 120: (1.980, 2.617)}
+
+
+@pytest.mark.parametrize('df', sorted(T_TABLE))
+def test_t_quantile_matches_table(df):
+    t95, t99 = T_TABLE[df]
+    assert t_quantile(0.975, df) == pytest.approx(t95, abs=1e-3)
+    assert t_quantile(0.995, df) == pytest.approx(t99, abs=1e-3)
+
+
+def test_t_quantile_is_symmetric_and_inverts_the_cdf():
+    for df in range(1, EXACT_T_DF):
+        assert t_quantile(0.5, df) == pytest.approx(0, abs=1e-9)
+        assert t_quantile(0.05, df) == pytest.approx(-t_quantile(0.95, df))
+        assert t_cdf(t_quantile(0.9, df), df) == pytest.approx(0.9)
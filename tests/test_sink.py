@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+from experiment import ModelSpec, experiment
+from sink import ResultSink
+
+A = ModelSpec(((1,) * 6,) * 7, 'data/ArrivalRates.xlsx', 'a', 'heap')
+B = ModelSpec(((2,) * 6,) * 7, 'data/ArrivalRates.xlsx', 'b', 'heap')
+RUN = dict(max_time=120, seed=3, printing=False, workers=1)
+
+
+def scalar_frame(df):
+    """Scalar stats of a results DataFrame, sorted by model and replication"""
+    df = df[[name for name in df.columns if 'hourly' not in name]]
+    return df.sort_values(['model', 'iteration']).reset_index(drop=True)
+
+
+def test_resumed_experiment_matches_uninterrupted_run(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    assert experiment([A, B], iteration=2, sink=path, **RUN) is None      # streams by default
+    with open(path, 'rb+') as f:            # lose the last unit in the middle of writing it
+        f.truncate(f.seek(0, 2) - 10)
+    experiment([A, B], iteration=4, sink=path, **RUN)
+
+    expected = experiment([A, B], iteration=4, output_report=False, **RUN)
+    resumed = ResultSink(path).load()
+    assert len(resumed) == 8
+    pd.testing.assert_frame_equal(scalar_frame(resumed), scalar_frame(expected), check_dtype=False)
+
+
+def test_resume_with_other_models_is_refused(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    experiment([A, B], iteration=1, sink=path, **RUN)
+    with pytest.raises(ValueError):
+        experiment([B, A], iteration=2, sink=path, **RUN)
+    with pytest.raises(ValueError):
+        experiment([A, B], iteration=2, sink=path, **dict(RUN, max_time=60))
+
+
+def test_summary_has_one_row_per_model_index(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    experiment([A, A._replace(rate_multiplier=2)], iteration=2, sink=path, **RUN)
+    summary = ResultSink(path).summary()
+    assert list(summary.index) == ['a', 'a']
+    assert summary['iteration'].tolist() == [0.5, 0.5]